@@ -0,0 +1,61 @@
+"""Benchmark: throughput de escritura de procesar_transaccion y soporte por configuración de BD.
+
+Cada configuración corre en un proceso propio (DATABASE_URL se lee al importar lifelink_app):
+  - sqlite-rollback: SQLite con journal clásico (SQLITE_WAL=0)
+  - sqlite-wal:      SQLite con WAL + synchronous=NORMAL + busy_timeout
+  - postgres:        sólo si se define BENCH_PG_URL (p. ej. postgresql://localhost/lifelink_bench);
+                     usa pool + psycopg2 verde. Escribe filas reales en esa base.
+
+Uso:  python benchmarks/bench_db_escritura.py [clientes] [operaciones_por_cliente]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+AQUI = os.path.abspath(__file__)
+
+def hijo(clientes, ops):
+    sys.path.insert(0, os.path.join(os.path.dirname(AQUI), '..'))
+    import eventlet
+    import lifelink_app as L
+    with L.app.app_context():
+        p = L.Publicacion(id_proveedor=1, nombre='Bench', categoria='Sangre', tipo_publicacion='Donacion', latitud=19.43, longitud=-99.13)
+        L.db.session.add(p); L.db.session.commit(); id_pub = p.id_oferta_insumo
+    sesiones = []
+    for _ in range(clientes):
+        c = L.app.test_client()
+        c.post('/login', data={'email': 'admin@lifelink.com', 'password': 'admin123'})
+        sesiones.append(c)
+    errores = [0]
+    def trabajar(c):
+        for i in range(ops):
+            r = c.post('/procesar_transaccion/%d' % id_pub, data={'mp': 'Efectivo'}) if i % 2 else c.post('/soporte', data={'m': 'bench'})
+            if r.status_code != 302: errores[0] += 1
+    t0 = time.perf_counter()
+    pool = eventlet.GreenPool(clientes)
+    for c in sesiones: pool.spawn(trabajar, c)
+    pool.waitall()
+    dt = time.perf_counter() - t0
+    print(json.dumps({'escrituras': clientes * ops, 'segundos': dt, 'por_segundo': clientes * ops / dt, 'errores': errores[0]}))
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    tmp = tempfile.mkdtemp()
+    configs = [('sqlite-rollback', {'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'rollback.db'), 'SQLITE_WAL': '0'}),
+               ('sqlite-wal', {'DATABASE_URL': 'sqlite:///' + os.path.join(tmp, 'wal.db'), 'SQLITE_WAL': '1'})]
+    if os.environ.get('BENCH_PG_URL'): configs.append(('postgres', {'DATABASE_URL': os.environ['BENCH_PG_URL']}))
+    else: print('(postgres omitido: defina BENCH_PG_URL)')
+    for nombre, env in configs:
+        salida = subprocess.run([sys.executable, AQUI, '--hijo', str(clientes), str(ops)], env=dict(os.environ, **env), capture_output=True, text=True)
+        linea = next((l for l in salida.stdout.splitlines() if l.startswith('{')), None)
+        if not linea: print('%-16s falló:\n%s' % (nombre, salida.stderr[-2000:])); continue
+        r = json.loads(linea)
+        print('%-16s %6d escrituras en %6.2f s  -> %8.1f escrituras/s  errores=%d' % (nombre, r['escrituras'], r['segundos'], r['por_segundo'], r['errores']))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--hijo': hijo(int(sys.argv[2]), int(sys.argv[3]))
+    else: main()
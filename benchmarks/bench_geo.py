@@ -0,0 +1,64 @@
+"""Benchmark: búsqueda por proximidad con rejilla indexada vs. escaneo completo.
+
+Uso:  python benchmarks/bench_geo.py [num_items] [consultas]
+Genera un catálogo sintético en una base SQLite temporal (no toca lifelink.db).
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+import lifelink_app as L
+
+# Centros urbanos de referencia (México) para una distribución realista de coordenadas
+CIUDADES = [(19.43, -99.13), (20.67, -103.35), (25.69, -100.32), (21.16, -86.85), (19.04, -98.20), (32.51, -117.04)]
+
+def poblar(sesion, total, rnd):
+    filas = []
+    for i in range(total):
+        clat, clng = rnd.choice(CIUDADES)
+        lat, lng = clat + rnd.gauss(0, 0.5), clng + rnd.gauss(0, 0.5)
+        filas.append({'id_proveedor': 1, 'nombre': 'Item %d' % i, 'categoria': rnd.choice(['Sangre', 'Farmacia', 'Insumo']),
+                      'tipo_publicacion': 'Donacion', 'precio': 0.0, 'latitud': lat, 'longitud': lng,
+                      'celda_lat': L.celda(lat), 'celda_lng': L.celda(lng)})
+    sesion.execute(L.Publicacion.__table__.insert(), filas)
+    sesion.commit()
+
+def escaneo_completo(sesion, lat, lng, n):
+    res = sorted(((L.distancia_km(lat, lng, p.latitud, p.longitud), p) for p in sesion.query(L.Publicacion)), key=lambda t: t[0])
+    return res[:n]
+
+def medir(fn, puntos):
+    t0 = time.perf_counter()
+    for lat, lng in puntos: fn(lat, lng)
+    return (time.perf_counter() - t0) / len(puntos) * 1000
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    consultas = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rnd = random.Random(42)
+    ruta = os.path.join(tempfile.mkdtemp(), 'bench_geo.db')
+    engine = create_engine('sqlite:///' + ruta)
+    L.Publicacion.__table__.create(engine)
+    with Session(engine) as sesion:
+        poblar(sesion, total, rnd)
+        puntos = [(c[0] + rnd.uniform(-0.3, 0.3), c[1] + rnd.uniform(-0.3, 0.3)) for c in (rnd.choice(CIUDADES) for _ in range(consultas))]
+        # Validación: ambos métodos deben devolver los mismos vecinos
+        lat, lng = puntos[0]
+        a = [p.id_oferta_insumo for _, p in L.mas_cercanos(sesion.query(L.Publicacion), lat, lng, 10)]
+        b = [p.id_oferta_insumo for _, p in escaneo_completo(sesion, lat, lng, 10)]
+        assert a == b, 'resultados distintos entre rejilla y escaneo'
+        t_rejilla = medir(lambda la, ln: L.mas_cercanos(sesion.query(L.Publicacion), la, ln, 10), puntos)
+        t_radio = medir(lambda la, ln: L.en_radio(sesion.query(L.Publicacion), la, ln, 5.0), puntos)
+        t_escaneo = medir(lambda la, ln: escaneo_completo(sesion, la, ln, 10), puntos[:max(1, consultas // 4)])
+    print('items=%d consultas=%d' % (total, consultas))
+    print('rejilla  n=10      %8.2f ms/consulta' % t_rejilla)
+    print('rejilla  radio=5km %8.2f ms/consulta' % t_radio)
+    print('escaneo  n=10      %8.2f ms/consulta  (x%.0f)' % (t_escaneo, t_escaneo / t_rejilla))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark: latencia del hub de eventlet (chat) durante una ráfaga de logins.
+
+Un greenthread "sonda" simula el tráfico de chat despertando cada 10 ms y mide cuánto tarde llega
+(retraso del hub). En paralelo se lanzan N logins contra /login:
+  - directo: check_password_hash en el hub (comportamiento anterior);
+  - pool:    verificar_password de lifelink_app (tpool + semáforo HASH_CONCURRENCIA).
+
+Uso:  python benchmarks/bench_hash_hub.py [logins]
+"""
+import os
+import sys
+import time
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_hash.db'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import eventlet
+import lifelink_app as L
+from werkzeug.security import check_password_hash
+
+PERIODO = 0.01
+
+def percentil(valores, p):
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(len(orden) * p / 100))]
+
+def sonda(retrasos, activo):
+    while activo[0]:
+        t0 = time.perf_counter()
+        eventlet.sleep(PERIODO)
+        retrasos.append((time.perf_counter() - t0 - PERIODO) * 1000)
+
+def login():
+    c = L.app.test_client()
+    c.post('/login', data={'email': 'admin@lifelink.com', 'password': 'admin123'})
+
+def escenario(nombre, verificador, logins):
+    L.verificar_password = verificador
+    retrasos, activo = [], [True]
+    g = eventlet.spawn(sonda, retrasos, activo)
+    eventlet.sleep(0.1)
+    t0 = time.perf_counter()
+    pool = eventlet.GreenPool(logins)
+    for _ in range(logins): pool.spawn(login)
+    pool.waitall()
+    total = time.perf_counter() - t0
+    activo[0] = False; g.wait()
+    print('%-8s logins=%d en %.2f s  retraso hub p50=%.1f ms  p99=%.1f ms  max=%.1f ms' % (nombre, logins, total, percentil(retrasos, 50), percentil(retrasos, 99), max(retrasos)))
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    original = L.verificar_password
+    escenario('directo', check_password_hash, logins)
+    escenario('pool', original, logins)
+
+if __name__ == '__main__':
+    main()
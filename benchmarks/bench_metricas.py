@@ -0,0 +1,88 @@
+"""Presupuesto de sobrecarga de la instrumentación de métricas.
+
+1. Costo directo de los hooks para una petición típica (inicio/fin HTTP, N sentencias SQL y
+   M plantillas), medido en el mismo proceso: es la cifra que se compara contra el presupuesto.
+2. A/B de extremo a extremo en /buscar, alternando rondas con los hooks conectados y
+   desconectados en el mismo proceso (informativo: el ruido entre rondas suele superar al costo).
+
+Termina con código 1 si el costo por petición supera el presupuesto. tests/test_metricas.py
+comprueba el mismo presupuesto (con holgura) y el formato de /metrics en cada corrida de pytest.
+
+Uso:  python benchmarks/bench_metricas.py [peticiones] [presupuesto_us]
+"""
+import os
+import sys
+import time
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_metricas.db'))
+os.environ['METRICAS'] = '1'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import lifelink_app as L
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQL_POR_PETICION, PLANTILLAS_POR_PETICION = 5, 3
+
+class _Conexion:
+    info = {}
+
+class _Plantilla:
+    name = 'bench.html'
+
+def costo_hooks(n):
+    # Replica las llamadas que recibe una petición instrumentada, sin el trabajo real de la vista
+    cx, tpl = _Conexion(), _Plantilla()
+    with L.app.test_request_context('/buscar'):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            L.metricas_inicio()
+            for _ in range(SQL_POR_PETICION):
+                L.sql_inicio(cx, None, 'SELECT 1', (), None, False); L.sql_fin(cx, None, 'SELECT 1', (), None, False)
+            for _ in range(PLANTILLAS_POR_PETICION):
+                L.plantilla_inicio(L.app, tpl, {}); L.plantilla_fin(L.app, tpl, {})
+            L.metricas_fin(None)
+        return (time.perf_counter() - t0) / n * 1e6
+
+def conectar(activo):
+    hooks = [(Engine, 'before_cursor_execute', L.sql_inicio), (Engine, 'after_cursor_execute', L.sql_fin)]
+    for objetivo, nombre, fn in hooks:
+        if activo and not event.contains(objetivo, nombre, fn): event.listen(objetivo, nombre, fn)
+        if not activo and event.contains(objetivo, nombre, fn): event.remove(objetivo, nombre, fn)
+    for lista, fn in ((L.app.before_request_funcs.setdefault(None, []), L.metricas_inicio), (L.app.teardown_request_funcs.setdefault(None, []), L.metricas_fin)):
+        if activo and fn not in lista: lista.append(fn)
+        if not activo and fn in lista: lista.remove(fn)
+    for senal, fn in ((L.before_render_template, L.plantilla_inicio), (L.template_rendered, L.plantilla_fin)):
+        if activo: senal.connect(fn, L.app)
+        else: senal.disconnect(fn)
+
+def extremo_a_extremo(n):
+    with L.app.app_context():
+        for i in range(200): L.db.session.add(L.Publicacion(id_proveedor=1, nombre='Item %d' % i, categoria='Sangre', latitud=19.4, longitud=-99.1))
+        L.db.session.commit()
+    c = L.app.test_client()
+    c.post('/login', data={'email': 'admin@lifelink.com', 'password': 'admin123'})
+    for _ in range(100): c.get('/buscar?cat=Sangre')
+    mejor = {True: None, False: None}
+    for ronda in range(6):
+        activo = ronda % 2 == 0
+        conectar(activo)
+        t0 = time.perf_counter()
+        for _ in range(n): c.get('/buscar?cat=Sangre')
+        dt = (time.perf_counter() - t0) / n * 1e6
+        mejor[activo] = dt if mejor[activo] is None else min(mejor[activo], dt)
+    conectar(True)
+    return mejor[False], mejor[True]
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    presupuesto = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    costo = costo_hooks(n * 10)
+    sin, con = extremo_a_extremo(n)
+    print('hooks por petición (%d SQL, %d plantillas): %.1f us' % (SQL_POR_PETICION, PLANTILLAS_POR_PETICION, costo))
+    print('/buscar extremo a extremo: sin=%.1f us  con=%.1f us  (%+.1f%%, informativo)' % (sin, con, (con - sin) / sin * 100))
+    print('presupuesto %.0f us/petición: %s' % (presupuesto, 'OK' if costo <= presupuesto else 'EXCEDIDO'))
+    sys.exit(0 if costo <= presupuesto else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Carga: latencia de reparto de 'nuevo_mensaje' entre varios workers vía el broker local.
+
+Levanta lifelink_broker.py y N procesos de lifelink_app.py (puertos consecutivos), conecta un
+cliente Socket.IO a cada worker en la misma sala, emite desde el worker 0 y mide la latencia de
+fan-out (p50/p95) a medida que se agregan workers. La entrega worker A -> worker B se comprueba
+en tests/test_broker.py.
+
+Uso:  python benchmarks/bench_socketio_fanout.py [max_workers] [mensajes]
+Requiere el cliente de python-socketio: pip install requests websocket-client
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import subprocess
+import statistics
+import requests
+import socketio
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PUERTO_BASE = 5100
+
+def esperar_puerto(puerto, limite=30):
+    fin = time.time() + limite
+    while time.time() < fin:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), 0.5).close(); return
+        except OSError: time.sleep(0.2)
+    raise RuntimeError('worker en puerto %d no respondió' % puerto)
+
+def preparar_sala(puerto):
+    # El chat exige participar en la solicitud: el admin publica un recurso y se lo solicita a sí mismo
+    url = 'http://127.0.0.1:%d' % puerto
+    http = requests.Session()
+    http.post(url + '/login', data={'email': 'admin@lifelink.com', 'password': 'admin123'}, allow_redirects=False)
+    http.post(url + '/publicar', data={'nombre': 'Bench fan-out', 'cat': 'Sangre', 'tp': 'Donacion', 'lat': '19.43', 'lng': '-99.13', 'dir': 'Bench'}, allow_redirects=False)
+    id_pub = http.get(url + '/api/catalogo', params={'n': 1}).json()['resultados'][0]['id']
+    http.post(url + '/procesar_transaccion/%d' % id_pub, data={'mp': 'Efectivo'}, allow_redirects=False)
+    ultima = http.get(url + '/api/solicitudes/exportar', params={'formato': 'ndjson'}).text.strip().splitlines()[-1]
+    return str(json.loads(ultima)['id_solicitud'])
+
+def cliente(puerto, recibidos, sala):
+    url = 'http://127.0.0.1:%d' % puerto
+    http = requests.Session()
+    http.post(url + '/login', data={'email': 'admin@lifelink.com', 'password': 'admin123'}, allow_redirects=False)
+    c = socketio.Client()
+    c.on('nuevo_mensaje', lambda d: recibidos.append((time.perf_counter(), d['msg'])))
+    c.connect(url, headers={'Cookie': '; '.join('%s=%s' % kv for kv in http.cookies.items())}, transports=['websocket'])
+    c.emit('join', {'room': sala}); time.sleep(0.2)
+    return c
+
+def medir(clientes, buzones, mensajes, sala):
+    # Latencia del último worker en recibir cada mensaje (peor caso del fan-out)
+    enviados = {}
+    for i in range(mensajes):
+        marca = 'bench-%d-%d' % (len(clientes), i)
+        enviados[marca] = time.perf_counter()
+        clientes[0].emit('enviar_mensaje', {'msg': marca, 'room': sala})
+        time.sleep(0.01)
+    time.sleep(1.0)
+    lat = []
+    for marca, t0 in enviados.items():
+        llegadas = [t for b in buzones for t, m in b if m == marca]
+        if len(llegadas) == len(buzones): lat.append((max(llegadas) - t0) * 1000)
+    return lat, len(enviados)
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    mensajes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    tmp = tempfile.mkdtemp()
+    cola = 'local://' + os.path.join(tmp, 'broker.sock')
+    base = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(tmp, 'fanout.db')
+    procesos = [subprocess.Popen([sys.executable, os.path.join(RAIZ, 'lifelink_broker.py'), cola], stdout=subprocess.DEVNULL)]
+    clientes, buzones = [], []
+    try:
+        time.sleep(0.5)
+        for w in range(max_workers):
+            puerto = PUERTO_BASE + w
+            env = dict(os.environ, PORT=str(puerto), SOCKETIO_MESSAGE_QUEUE=cola, DATABASE_URL=base)
+            procesos.append(subprocess.Popen([sys.executable, os.path.join(RAIZ, 'lifelink_app.py')], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            esperar_puerto(puerto)
+            if w == 0: sala = preparar_sala(puerto)
+            buzones.append([]); clientes.append(cliente(puerto, buzones[-1], sala))
+            lat, total = medir(clientes, buzones, mensajes, sala)
+            if not lat: print('workers=%d  sin entregas completas' % (w + 1)); continue
+            q = statistics.quantiles(lat, n=100) if len(lat) > 1 else lat * 99
+            print('workers=%d  entregados=%d/%d  p50=%.2f ms  p95=%.2f ms' % (w + 1, len(lat), total, q[49], q[94]))
+    finally:
+        for c in clientes:
+            try: c.disconnect()
+            except Exception: pass
+        for p in procesos: p.terminate()
+
+if __name__ == '__main__':
+    main()
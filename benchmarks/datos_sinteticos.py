@@ -0,0 +1,90 @@
+"""Generador reproducible de datos sintéticos para LifeLink (User, Publicacion, Solicitud, Ticket).
+
+Genera e inserta lote por lote con executemany (sin pasar por el ORM ni tener la tabla completa en
+memoria), así que rellena a mano las columnas que
+normalmente mantienen los eventos: celda_lat/celda_lng y ubicacion_norm. El índice FTS se mantiene
+solo por los triggers de la base.
+
+Uso:  DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/datos_sinteticos.py [escala] [semilla]
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Ciudades con (nombre, lat, lng, peso): la densidad de publicaciones sigue aproximadamente la población
+CIUDADES = [('Ciudad de México', 19.43, -99.13, 9), ('Guadalajara', 20.67, -103.35, 5), ('Monterrey', 25.69, -100.32, 5),
+            ('Puebla', 19.04, -98.20, 3), ('Tijuana', 32.51, -117.04, 3), ('Mérida', 20.97, -89.62, 2),
+            ('Querétaro', 20.59, -100.39, 2), ('Cancún', 21.16, -86.85, 1), ('Oaxaca', 17.07, -96.72, 1)]
+TIPOS_SANGRE = ['O+', 'O+', 'O+', 'A+', 'A+', 'B+', 'O-', 'A-', 'B-', 'AB+', 'AB-']
+CATEGORIAS = ['Sangre', 'Farmacia', 'Insumo']
+INSUMOS = {'Sangre': ['Unidad de sangre', 'Plaquetas', 'Plasma fresco'], 'Farmacia': ['Paracetamol', 'Insulina', 'Amoxicilina', 'Omeprazol'],
+           'Insumo': ['Silla de ruedas', 'Muletas', 'Concentrador de oxígeno', 'Glucómetro']}
+CALLES = ['Av. Reforma', 'Calle Juárez', 'Av. Hidalgo', 'Calle Morelos', 'Av. Insurgentes', 'Calle Allende']
+PASSWORD_BENCH = 'bench123'
+LOTE = 5000
+
+def escalas(escala):
+    # Proporciones por defecto respecto al número de usuarios
+    return {'usuarios': escala, 'publicaciones': escala, 'solicitudes': escala, 'tickets': max(escala // 10, 1)}
+
+def _insertar(L, tabla, filas):
+    # filas es un generador: sólo un lote de LOTE diccionarios vive en memoria a la vez
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= LOTE:
+            L.db.session.execute(tabla.insert(), lote); lote = []
+    if lote: L.db.session.execute(tabla.insert(), lote)
+    L.db.session.commit()
+
+def generar(L, escala=10000, semilla=42):
+    """Puebla la base configurada de lifelink_app y devuelve los conteos y rangos de ids creados."""
+    rnd = random.Random(semilla)
+    n = escalas(escala)
+    pesos = [c[3] for c in CIUDADES]
+    with L.app.app_context():
+        hash_bench = L.hash_password(PASSWORD_BENCH)  # un solo hash compartido: el costo es el del login, no el del seed
+        base_u = (L.db.session.query(L.db.func.max(L.User.id)).scalar() or 0) + 1
+        def usuarios():
+            for i in range(n['usuarios']):
+                ciudad = rnd.choices(CIUDADES, pesos)[0][0]
+                yield {'nombre': 'Nodo %d' % (base_u + i), 'email': 'bench%d@lifelink.test' % (base_u + i), 'telefono': '55%08d' % i,
+                       'tipo_sangre': rnd.choice(TIPOS_SANGRE), 'ubicacion': ciudad, 'ubicacion_norm': L.normalizar_ubicacion(ciudad), 'password_hash': hash_bench}
+        _insertar(L, L.User.__table__, usuarios())
+        ids_u = range(base_u, base_u + n['usuarios'])
+
+        base_p = (L.db.session.query(L.db.func.max(L.Publicacion.id_oferta_insumo)).scalar() or 0) + 1
+        def publicaciones():
+            for i in range(n['publicaciones']):
+                ciudad, clat, clng, _ = rnd.choices(CIUDADES, pesos)[0]
+                lat, lng = clat + rnd.gauss(0, 0.08), clng + rnd.gauss(0, 0.08)
+                cat = rnd.choice(CATEGORIAS)
+                tipo = 'Donacion' if cat == 'Sangre' or rnd.random() < 0.6 else 'Venta'
+                yield {'id_proveedor': rnd.choice(ids_u), 'nombre': rnd.choice(INSUMOS[cat]), 'categoria': cat, 'tipo_publicacion': tipo,
+                       'precio': 0.0 if tipo == 'Donacion' else round(rnd.uniform(20, 5000), 2), 'imagen_url': L.IMAGEN_PENDIENTE,
+                       'latitud': lat, 'longitud': lng, 'direccion_text': '%s %d, %s' % (rnd.choice(CALLES), rnd.randint(1, 999), ciudad),
+                       'celda_lat': L.celda(lat), 'celda_lng': L.celda(lng)}
+        _insertar(L, L.Publicacion.__table__, publicaciones())
+        ids_p = range(base_p, base_p + n['publicaciones'])
+
+        sols = ({'id_solicitante': rnd.choice(ids_u), 'id_publicacion': rnd.choice(ids_p), 'metodo_pago': rnd.choice(['Tarjeta', 'Efectivo']),
+                 'estatus': 'En Coordinación'} for _ in range(n['solicitudes']))
+        _insertar(L, L.Solicitud.__table__, sols)
+
+        ahora = datetime.utcnow()
+        tickets = ({'id_usuario': rnd.choice(ids_u), 'mensaje': 'Ticket sintético %d' % i, 'fecha': ahora - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))}
+                   for i in range(n['tickets']))
+        _insertar(L, L.Ticket.__table__, tickets)
+    return dict(n, ids_usuarios=(ids_u.start, ids_u.stop), ids_publicaciones=(ids_p.start, ids_p.stop))
+
+if __name__ == '__main__':
+    import lifelink_app as L
+    escala = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    semilla = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+    t0 = time.perf_counter()
+    r = generar(L, escala, semilla)
+    print('%s en %.1f s (base: %s)' % ({k: v for k, v in r.items() if not k.startswith('ids')}, time.perf_counter() - t0, L.app.config['SQLALCHEMY_DATABASE_URI']))
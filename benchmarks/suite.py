@@ -0,0 +1,156 @@
+"""Suite de carga reproducible: /buscar, /dashboard, login, publicar y chat por Socket.IO.
+
+Crea una base temporal (o usa DATABASE_URL), la puebla con datos_sinteticos.generar y corre cada
+escenario con un pool de clientes concurrentes (greenthreads). Reporta p50/p95/p99 y throughput,
+guarda el resultado en JSON y, con --comparar, marca regresiones de p95 o throughput.
+
+Uso:
+    python benchmarks/suite.py --escala 10000 --salida base.json
+    python benchmarks/suite.py --escala 10000 --comparar base.json --tolerancia 0.2
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import subprocess
+from datetime import datetime
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AQUI)
+sys.path.insert(0, os.path.join(AQUI, '..'))
+
+# PNG de 1x1: publicar no depende de Pillow en el cliente de carga
+PNG_MINIMO = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de0000000c4944415408d763f8cfc0000003010100c9fe92ef0000000049454e44ae426082')
+
+def percentil(valores, p):
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(len(orden) * p / 100))] if orden else 0.0
+
+def medir(nombre, operacion, iteraciones, concurrencia):
+    import eventlet
+    lat, errores = [], [0]
+    def una(i):
+        t0 = time.perf_counter()
+        try:
+            if not operacion(i): errores[0] += 1
+        except Exception: errores[0] += 1
+        lat.append((time.perf_counter() - t0) * 1000)
+    t0 = time.perf_counter()
+    pool = eventlet.GreenPool(concurrencia)
+    for i in range(iteraciones): pool.spawn(una, i)
+    pool.waitall()
+    total = time.perf_counter() - t0
+    r = {'n': iteraciones, 'errores': errores[0], 'p50_ms': percentil(lat, 50), 'p95_ms': percentil(lat, 95), 'p99_ms': percentil(lat, 99),
+         'media_ms': sum(lat) / len(lat), 'rps': iteraciones / total}
+    print('%-10s n=%-5d err=%-3d p50=%8.2f  p95=%8.2f  p99=%8.2f ms  %8.1f op/s' % (nombre, r['n'], r['errores'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['rps']))
+    return r
+
+def escenarios(L, datos, args, rnd):
+    import cloudinary.uploader
+    from datos_sinteticos import PASSWORD_BENCH, CATEGORIAS
+    # Cloudinary simulado: publicar ejercita la cola de medios sin red
+    cloudinary.uploader.upload = lambda archivo, **kw: {'secure_url': 'https://stub.cloudinary.test/%s.jpg' % kw.get('public_id', 'x')}
+    L.cola_media.almacen = L.AlmacenCloudinary()
+    u0, u1 = datos['ids_usuarios']
+
+    def email(uid): return 'bench%d@lifelink.test' % uid
+
+    def cliente_logueado(uid):
+        c = L.app.test_client()
+        c.post('/login', data={'email': email(uid), 'password': PASSWORD_BENCH})
+        return c
+
+    sesiones = [cliente_logueado(rnd.randrange(u0, u1)) for _ in range(args.concurrencia)]
+    # Chat: sólo los participantes pueden entrar a la sala; varias conexiones por participante (fan-out real)
+    with L.app.app_context():
+        sol = L.Solicitud.query.order_by(L.Solicitud.id_solicitud).first()
+        sala, participantes = str(sol.id_solicitud), (sol.id_solicitante, sol.publicacion.id_proveedor)
+    sesiones_chat = [cliente_logueado(participantes[i % 2]) for i in range(args.concurrencia)]
+    terminos = ['sangre', 'paracetamol', 'insulina', 'reforma', 'monterrey', 'oxigeno']
+
+    def buscar(i):
+        params = {}
+        if i % 2: params['cat'] = rnd.choice(CATEGORIAS)
+        if i % 3 == 0: params['q'] = rnd.choice(terminos)
+        if i % 5 == 0: params['pmax'] = 500
+        r = L.app.test_client().get('/buscar', query_string=params)
+        return r.status_code == 200
+
+    def dashboard(i): return sesiones[i % len(sesiones)].get('/dashboard').status_code == 200
+
+    def login(i):
+        r = L.app.test_client().post('/login', data={'email': email(rnd.randrange(u0, u1)), 'password': PASSWORD_BENCH})
+        return r.status_code == 302
+
+    def publicar(i):
+        r = sesiones[i % len(sesiones)].post('/publicar', content_type='multipart/form-data', data={
+            'nombre': 'Bench %d' % i, 'cat': 'Sangre', 'tp': 'Donacion', 'lat': '19.43', 'lng': '-99.13', 'dir': 'Bench', 'imagen': (io.BytesIO(PNG_MINIMO), 'b.png')})
+        return r.status_code == 302
+
+    sockets = [L.socketio.test_client(L.app, flask_test_client=c) for c in sesiones_chat]
+    for s in sockets: s.emit('join', {'room': sala})
+
+    def join(i):
+        sockets[i % len(sockets)].emit('join', {'room': sala})
+        return True
+
+    def chat(i):
+        sockets[i % len(sockets)].emit('enviar_mensaje', {'msg': 'mensaje %d' % i, 'room': sala})
+        return True
+
+    return [('buscar', buscar, args.iteraciones), ('dashboard', dashboard, args.iteraciones), ('login', login, max(args.iteraciones // 10, 1)),
+            ('publicar', publicar, max(args.iteraciones // 5, 1)), ('join', join, max(args.iteraciones // 5, 1)), ('chat', chat, args.iteraciones * 5)], sockets
+
+def comparar(actual, base, tolerancia):
+    regresiones = []
+    for nombre, r in actual['escenarios'].items():
+        b = base.get('escenarios', {}).get(nombre)
+        if not b: continue
+        dp95 = (r['p95_ms'] - b['p95_ms']) / b['p95_ms'] if b['p95_ms'] else 0.0
+        drps = (r['rps'] - b['rps']) / b['rps'] if b['rps'] else 0.0
+        marca = 'REGRESIÓN' if dp95 > tolerancia or drps < -tolerancia else 'ok'
+        print('%-10s p95 %+6.1f%%  throughput %+6.1f%%  %s' % (nombre, dp95 * 100, drps * 100, marca))
+        if marca != 'ok': regresiones.append(nombre)
+    return regresiones
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--escala', type=int, default=10000, help='usuarios/publicaciones/solicitudes a generar (10k-1M)')
+    ap.add_argument('--semilla', type=int, default=42)
+    ap.add_argument('--iteraciones', type=int, default=500)
+    ap.add_argument('--concurrencia', type=int, default=10)
+    ap.add_argument('--salida', default='bench_resultados_%s.json' % datetime.now().strftime('%Y%m%d_%H%M%S'))
+    ap.add_argument('--comparar', help='JSON de una corrida anterior')
+    ap.add_argument('--tolerancia', type=float, default=0.2, help='variación relativa admitida antes de marcar regresión')
+    args = ap.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'suite.db'))
+    os.environ.setdefault('MEDIA_DIR', tempfile.mkdtemp())
+    import lifelink_app as L
+    from datos_sinteticos import generar
+
+    t0 = time.perf_counter()
+    datos = generar(L, args.escala, args.semilla)
+    print('datos: escala=%d en %.1f s' % (args.escala, time.perf_counter() - t0))
+    rnd = random.Random(args.semilla)
+    lista, sockets = escenarios(L, datos, args, rnd)
+    resultados = {nombre: medir(nombre, op, n, args.concurrencia) for nombre, op, n in lista}
+    for s in sockets: s.disconnect()
+
+    try: commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=AQUI, capture_output=True, text=True).stdout.strip()
+    except OSError: commit = None
+    salida = {'fecha': datetime.now().isoformat(), 'commit': commit, 'python': platform.python_version(), 'base_datos': L.app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+              'escala': args.escala, 'semilla': args.semilla, 'iteraciones': args.iteraciones, 'concurrencia': args.concurrencia, 'escenarios': resultados}
+    with open(args.salida, 'w') as f: json.dump(salida, f, indent=2)
+    print('resultados en %s' % args.salida)
+    if args.comparar:
+        with open(args.comparar) as f: base = json.load(f)
+        if comparar(salida, base, args.tolerancia): sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,39 @@
 import eventlet
+from eventlet import tpool
 # Parcheo obligatorio para estabilidad de WebSockets en Render
 eventlet.monkey_patch()
 
 import os
+import io
+import csv
+import json
+import math
+import uuid
+import queue
+import socket
+import bisect
+import contextvars
+import hashlib
+import functools
+import time
+import atexit
+import threading
+import sqlite3
+import unicodedata
+import click
 import jinja2
+from collections import OrderedDict
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash
+from markupsafe import Markup
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, send_from_directory, session, make_response, stream_with_context, before_render_template, template_rendered, Response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text, column, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.orm import joinedload
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_socketio import SocketIO, emit, join_room
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 import cloudinary
 import cloudinary.uploader
 
@@ -50,6 +74,27 @@ base_t = """
     </style>
 </head>
 <body class="bg-slate-50 flex flex-col min-h-screen font-sans text-slate-900 uppercase font-bold italic">
+    {{ fragmento('navbar.html') }}
+    <main class="flex-grow">
+        {% with messages = get_flashed_messages() %}
+          {% if messages %}
+            {% for message in messages %}
+              <div class="max-w-2xl mx-auto mt-4 px-4">
+                <div class="p-2 rounded-lg bg-blue-50 text-blue-700 border border-blue-100 text-[8px] flex items-center gap-2">
+                   <i class="fas fa-info-circle"></i> {{ message }}
+                </div>
+              </div>
+            {% endfor %}
+          {% endif %}
+        {% endwith %}
+        {% block content %}{% endblock %}
+    </main>
+    {{ fragmento('footer.html', por_usuario=False) }}
+</body>
+</html>
+"""
+
+navbar_t = """
     <nav class="bg-white border-b border-slate-200 sticky top-0 z-50">
         <div class="max-w-7xl mx-auto px-4 h-14 flex justify-between items-center">
             <div class="flex items-center gap-6">
@@ -83,20 +128,9 @@ base_t = """
             </div>
         </div>
     </nav>
-    <main class="flex-grow">
-        {% with messages = get_flashed_messages() %}
-          {% if messages %}
-            {% for message in messages %}
-              <div class="max-w-2xl mx-auto mt-4 px-4">
-                <div class="p-2 rounded-lg bg-blue-50 text-blue-700 border border-blue-100 text-[8px] flex items-center gap-2">
-                   <i class="fas fa-info-circle"></i> {{ message }}
-                </div>
-              </div>
-            {% endfor %}
-          {% endif %}
-        {% endwith %}
-        {% block content %}{% endblock %}
-    </main>
+"""
+
+footer_t = """
     <footer class="py-6 bg-white border-t border-slate-100 flex flex-col items-center gap-3 text-[7px] text-slate-400">
         <div class="flex gap-6">
             <a href="{{ url_for('politicas') }}" class="hover:text-brand">Privacidad Médica</a>
@@ -105,8 +139,6 @@ base_t = """
         </div>
         <p class="tracking-[0.2em]">LifeLink • TechPulse Solutions • 2026</p>
     </footer>
-</body>
-</html>
 """
 
 home_t = """
@@ -201,26 +233,202 @@ dashboard_t = """
 # ==========================================
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'lifelink_final_full_master_v6'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///lifelink.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# --- MOTOR DE BASE DE DATOS ---
+def url_base_datos():
+    # DATABASE_URL (Render/Heroku entregan 'postgres://', que SQLAlchemy ya no acepta)
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///lifelink.db'
+    return 'postgresql://' + url[len('postgres://'):] if url.startswith('postgres://') else url
+
+def opciones_motor(url):
+    if url.startswith('sqlite'): return {}
+    return {'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)), 'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_pre_ping': True, 'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)), 'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30))}
+
+def psycopg2_verde():
+    # Equivalente a psycogreen: psycopg2 en modo asíncrono cede al hub de eventlet en vez de bloquearlo
+    from psycopg2 import extensions, OperationalError
+    from eventlet.hubs import trampoline
+    def esperar(conn, timeout=-1):
+        while True:
+            estado = conn.poll()
+            if estado == extensions.POLL_OK: return
+            elif estado == extensions.POLL_READ: trampoline(conn.fileno(), read=True)
+            elif estado == extensions.POLL_WRITE: trampoline(conn.fileno(), write=True)
+            else: raise OperationalError("Estado de poll inesperado: %r" % estado)
+    extensions.set_wait_callback(esperar)
+
+app.config['SQLALCHEMY_DATABASE_URI'] = url_base_datos()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'): psycopg2_verde()
+
+@event.listens_for(Engine, 'connect')
+def pragmas_sqlite(dbapi_conn, registro):
+    # WAL: lectores no bloquean al escritor; NORMAL es seguro con WAL; busy_timeout evita 'database is locked'
+    if not isinstance(dbapi_conn, sqlite3.Connection): return
+    cur = dbapi_conn.cursor()
+    if os.environ.get('SQLITE_WAL', '1') != '0': cur.execute('PRAGMA journal_mode=WAL'); cur.execute('PRAGMA synchronous=NORMAL')
+    cur.execute('PRAGMA busy_timeout=%d' % int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)))
+    cur.close()
+
+# --- INSTRUMENTACIÓN Y MÉTRICAS (formato Prometheus en /metrics) ---
+METRICAS_ACTIVAS = os.environ.get('METRICAS', '1') != '0'
+SQL_LENTA_MS = float(os.environ.get('SQL_LENTA_MS', 200))
+CUBETAS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histograma:
+    __slots__ = ('conteos', 'suma', 'n')
+    def __init__(self): self.conteos, self.suma, self.n = [0] * (len(CUBETAS_SEGUNDOS) + 1), 0.0, 0
+    def observar(self, v):
+        self.conteos[bisect.bisect_left(CUBETAS_SEGUNDOS, v)] += 1; self.suma += v; self.n += 1
+
+class Metricas:
+    # Registro mínimo en memoria: histogramas y contadores con una sola etiqueta; O(1) por observación
+    AYUDA = {
+        'lifelink_http_request_seconds': ('histogram', 'Latencia de peticiones HTTP por endpoint'),
+        'lifelink_socket_event_seconds': ('histogram', 'Latencia de eventos Socket.IO por evento'),
+        'lifelink_template_render_seconds': ('histogram', 'Tiempo de render de plantillas'),
+        'lifelink_sql_statements_total': ('counter', 'Sentencias SQL ejecutadas por origen (endpoint, socket:evento o fondo)'),
+        'lifelink_sql_seconds_total': ('counter', 'Tiempo acumulado en SQL por origen'),
+        'lifelink_sql_lentas_total': ('counter', 'Sentencias SQL por encima de SQL_LENTA_MS por origen'),
+    }
+    ETIQUETA = {'lifelink_http_request_seconds': 'endpoint', 'lifelink_socket_event_seconds': 'evento', 'lifelink_template_render_seconds': 'plantilla'}
+
+    def __init__(self):
+        self.histogramas, self.contadores, self.lock = {}, {}, threading.Lock()
+
+    def observar(self, nombre, etiqueta, valor):
+        with self.lock:
+            h = self.histogramas.get((nombre, etiqueta))
+            if h is None: h = self.histogramas[(nombre, etiqueta)] = Histograma()
+            h.observar(valor)
+
+    def sumar(self, nombre, etiqueta, valor=1):
+        with self.lock: self.contadores[(nombre, etiqueta)] = self.contadores.get((nombre, etiqueta), 0) + valor
+
+    def exportar(self):
+        lineas, vistos = [], set()
+        def cabecera(nombre):
+            if nombre not in vistos:
+                vistos.add(nombre); tipo, ayuda = self.AYUDA[nombre]
+                lineas.extend(['# HELP %s %s' % (nombre, ayuda), '# TYPE %s %s' % (nombre, tipo)])
+        with self.lock:
+            histogramas = sorted((k, (list(h.conteos), h.suma, h.n)) for k, h in self.histogramas.items())
+            contadores = sorted(self.contadores.items())
+        for (nombre, etiqueta), (conteos, suma, n) in histogramas:
+            cabecera(nombre); et = '%s="%s"' % (self.ETIQUETA[nombre], escapar_etiqueta(etiqueta)); acumulado = 0
+            for limite, c in zip(CUBETAS_SEGUNDOS, conteos):
+                acumulado += c; lineas.append('%s_bucket{%s,le="%g"} %d' % (nombre, et, limite, acumulado))
+            lineas += ['%s_bucket{%s,le="+Inf"} %d' % (nombre, et, n), '%s_sum{%s} %.6f' % (nombre, et, suma), '%s_count{%s} %d' % (nombre, et, n)]
+        for (nombre, etiqueta), valor in contadores:
+            cabecera(nombre); lineas.append('%s{origen="%s"} %s' % (nombre, escapar_etiqueta(etiqueta), valor))
+        return lineas
+
+def escapar_etiqueta(v): return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metricas = Metricas()
+
+class Medicion:
+    # Acumuladores de la petición/evento en curso; las sentencias SQL se suman aquí y se vuelcan al cerrar
+    __slots__ = ('origen', 't0', 'sql', 'sql_segundos', 'sql_lentas', 'plantillas')
+    def __init__(self, origen):
+        self.origen, self.t0, self.sql, self.sql_segundos, self.sql_lentas, self.plantillas = origen, time.perf_counter(), 0, 0.0, 0, []
+
+# ContextVar en lugar de flask.g: cada acceso a g pasa por un LocalProxy, demasiado caro por sentencia SQL
+_medicion = contextvars.ContextVar('lifelink_medicion', default=None)
+
+def iniciar_medicion(origen): _medicion.set(Medicion(origen))
+
+def cerrar_medicion(histograma, etiqueta):
+    m = _medicion.get()
+    if m is None: return
+    _medicion.set(None)
+    dt = time.perf_counter() - m.t0
+    with metricas.lock:
+        h = metricas.histogramas.get((histograma, etiqueta))
+        if h is None: h = metricas.histogramas[(histograma, etiqueta)] = Histograma()
+        h.observar(dt)
+        if m.sql:
+            c = metricas.contadores
+            c[('lifelink_sql_statements_total', m.origen)] = c.get(('lifelink_sql_statements_total', m.origen), 0) + m.sql
+            c[('lifelink_sql_seconds_total', m.origen)] = c.get(('lifelink_sql_seconds_total', m.origen), 0) + m.sql_segundos
+            if m.sql_lentas: c[('lifelink_sql_lentas_total', m.origen)] = c.get(('lifelink_sql_lentas_total', m.origen), 0) + m.sql_lentas
+
+def medido(evento):
+    # Decorador para handlers de Socket.IO: latencia del evento y atribución de SQL a 'socket:<evento>'
+    def decorador(f):
+        if not METRICAS_ACTIVAS: return f
+        @functools.wraps(f)
+        def envoltura(*a, **kw):
+            iniciar_medicion('socket:' + evento)
+            try: return f(*a, **kw)
+            finally: cerrar_medicion('lifelink_socket_event_seconds', evento)
+        return envoltura
+    return decorador
+
+if METRICAS_ACTIVAS:
+    @app.before_request
+    def metricas_inicio(): iniciar_medicion(request.endpoint or 'sin_ruta')
+
+    @app.teardown_request
+    def metricas_fin(exc):
+        m = _medicion.get()
+        if m is not None: cerrar_medicion('lifelink_http_request_seconds', m.origen)
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def sql_inicio(conn, cursor, statement, params, context, executemany): conn.info['_met_t0'] = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def sql_fin(conn, cursor, statement, params, context, executemany):
+        dt = time.perf_counter() - conn.info.pop('_met_t0', time.perf_counter())
+        lenta, m = dt * 1000 >= SQL_LENTA_MS, _medicion.get()
+        if m is not None:
+            m.sql += 1; m.sql_segundos += dt; m.sql_lentas += lenta
+        else:  # SQL fuera de una petición o evento (tareas de fondo, arranque)
+            metricas.sumar('lifelink_sql_statements_total', 'fondo'); metricas.sumar('lifelink_sql_seconds_total', 'fondo', dt)
+            if lenta: metricas.sumar('lifelink_sql_lentas_total', 'fondo')
+        if lenta: app.logger.warning("SQL lenta (%.1f ms) en %s: %s", dt * 1000, m.origen if m else 'fondo', statement[:500])
+
+    @before_render_template.connect_via(app)
+    def plantilla_inicio(sender, template, context, **extra):
+        m = _medicion.get()
+        if m is not None: m.plantillas.append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def plantilla_fin(sender, template, context, **extra):
+        m = _medicion.get()
+        if m is not None and m.plantillas: metricas.observar('lifelink_template_render_seconds', template.name, time.perf_counter() - m.plantillas.pop())
+
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users_v6'
+    # Índice para el emparejamiento de donantes: (ciudad normalizada, tipo de sangre, id)
+    __table_args__ = (db.Index('ix_users_ubic_sangre_id', 'ubicacion_norm', 'tipo_sangre', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     telefono = db.Column(db.String(20))
     tipo_sangre = db.Column(db.String(10))
     ubicacion = db.Column(db.String(100))
+    ubicacion_norm = db.Column(db.String(100))
     password_hash = db.Column(db.String(255), nullable=False)
     def get_id(self): return str(self.id)
 
 class Publicacion(db.Model):
     __tablename__ = 'items_v6'
+    # Índices compuestos para filtros + paginación por cursor en /buscar
+    __table_args__ = (
+        db.Index('ix_items_cat_id', 'categoria', 'id_oferta_insumo'),
+        db.Index('ix_items_tipo_id', 'tipo_publicacion', 'id_oferta_insumo'),
+        # Categoría + tipo recorridos en orden de PK: el rango de precio queda como filtro residual sin ordenar
+        db.Index('ix_items_cat_tipo_id', 'categoria', 'tipo_publicacion', 'id_oferta_insumo'),
+        # Celda + latitud: dentro de cada celda la franja de latitud de la caja también se busca por índice
+        db.Index('ix_items_celda_lat', 'celda_lat', 'celda_lng', 'latitud'),
+    )
     id_oferta_insumo = db.Column(db.Integer, primary_key=True)
     id_proveedor = db.Column(db.Integer, db.ForeignKey('users_v6.id'))
     nombre = db.Column(db.String(100), nullable=False)
@@ -228,9 +436,13 @@ class Publicacion(db.Model):
     tipo_publicacion = db.Column(db.String(50))
     precio = db.Column(db.Float, default=0.0)
     imagen_url = db.Column(db.String(500))
+    imagen_mini_url = db.Column(db.String(500))
     latitud = db.Column(db.Float)
     longitud = db.Column(db.Float)
     direccion_text = db.Column(db.String(500))
+    # Celda de rejilla geográfica (ver TAM_CELDA) para búsquedas de proximidad indexadas
+    celda_lat = db.Column(db.Integer)
+    celda_lng = db.Column(db.Integer)
     proveedor = db.relationship('User', backref='items')
 
 class Solicitud(db.Model):
@@ -251,17 +463,40 @@ class Ticket(db.Model):
     fecha = db.Column(db.DateTime, default=datetime.utcnow)
     usuario = db.relationship('User', backref='tickets')
 
+class Mensaje(db.Model):
+    __tablename__ = 'messages_v6'
+    __table_args__ = (db.Index('ix_messages_solicitud_id', 'id_solicitud', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    id_solicitud = db.Column(db.Integer, db.ForeignKey('orders_v6.id_solicitud'), nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey('users_v6.id'))
+    autor = db.Column(db.String(100))
+    texto = db.Column(db.Text, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CambioCatalogo(db.Model):
+    # Bitácora de altas/bajas/cambios del catálogo: el id es la versión del catálogo
+    __tablename__ = 'catalog_changes_v6'
+    id = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(10), nullable=False)
+    id_publicacion = db.Column(db.Integer, nullable=False)  # sin FK: las bajas sobreviven a la publicación
+    categoria = db.Column(db.String(50))
+    celda_lat = db.Column(db.Integer)
+    celda_lng = db.Column(db.Integer)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
 # CARGADOR DE PLANTILLAS
 app.jinja_loader = jinja2.DictLoader({
     'base.html': base_t,
+    'navbar.html': navbar_t,
+    'footer.html': footer_t,
     'home.html': home_t,
     'dashboard.html': dashboard_t,
     'checkout.html': """{% extends "base.html" %}{% block content %}<div class="max-w-md mx-auto py-16 px-4 text-center uppercase font-black italic"><div class="bg-white p-10 rounded-3xl shadow-xl border"><h2>Validación</h2><div class="bg-slate-50 p-6 rounded-2xl my-6"><img src="{{ pub.imagen_url }}" class="w-24 h-24 rounded-lg mx-auto mb-4 object-cover"><p class="text-xs">{{ pub.nombre }}</p></div><form action="{{ url_for('procesar_transaccion', id=pub.id_oferta_insumo) }}" method="POST" class="text-left space-y-4"><label class="block text-[8px] text-slate-400">MÉTODO DE PAGO:</label><label class="flex items-center gap-3 p-3 bg-slate-50 rounded-xl cursor-pointer hover:border-brand border-2 border-transparent"><input type="radio" name="mp" value="Tarjeta" required><span class="text-[9px]">Tarjeta Bancaria</span></label><label class="flex items-center gap-3 p-3 bg-slate-50 rounded-xl cursor-pointer hover:border-brand border-2 border-transparent"><input type="radio" name="mp" value="Efectivo"><span class="text-[9px]">Efectivo Contra Entrega</span></label><button class="w-full btn-medical py-4 rounded-xl text-sm shadow-lg mt-4">Confirmar Solicitud</button></form></div></div>{% endblock %}""",
     'login.html': """{% extends "base.html" %}{% block content %}<div class="max-w-md mx-auto py-16 text-center"><h2>Acceso</h2><form method="POST" class="mt-8 space-y-4"><input name="email" type="email" placeholder="CORREO" required class="w-full p-4 border rounded-xl text-xs"><input name="password" type="password" placeholder="PASSWORD" required class="w-full p-4 border rounded-xl text-xs"><button class="w-full btn-medical py-4 text-sm mt-4">Entrar</button></form></div>{% endblock %}""",
     'register.html': """{% extends "base.html" %}{% block content %}<div class="max-w-xl mx-auto py-12 px-4 uppercase font-black"><div class="bg-white p-8 rounded-3xl shadow-xl border"><h2>Registro Nodo</h2><form method="POST" class="grid grid-cols-2 gap-4 mt-6"><input name="nombre" placeholder="NOMBRE" required class="col-span-2 p-3 border rounded-xl text-xs"><select name="sangre" required class="p-3 border rounded-xl text-[9px]"><option value="">SANGRE</option><option>O+</option><option>O-</option><option>A+</option><option>A-</option><option>B+</option><option>B-</option><option>AB+</option><option>AB-</option></select><input name="tel" placeholder="WHATSAPP" required class="p-3 border rounded-xl text-xs"><input name="ub" placeholder="CIUDAD" required class="p-3 border rounded-xl text-xs"><input name="email" type="email" placeholder="CORREO" required class="p-3 border rounded-xl text-xs"><input name="pass" type="password" placeholder="CONTRASEÑA" required class="col-span-2 p-3 border rounded-xl text-xs"><button class="col-span-2 btn-medical py-4 text-sm mt-4">Unirse</button></form></div></div>{% endblock %}""",
     'publish.html': """{% extends "base.html" %}{% block content %}<div class="max-w-4xl mx-auto py-10 px-4 uppercase font-black italic"><div class="bg-white rounded-3xl shadow-xl p-8 border"><h2>PUBLICAR INSUMO</h2><form method="POST" enctype="multipart/form-data" class="space-y-6 mt-6"><div class="grid md:grid-cols-2 gap-6"><div><label class="block text-[8px] mb-2">FOTO REAL:</label><input type="file" name="imagen" required class="text-[8px]"></div><div class="space-y-4"><input name="nombre" placeholder="DENOMINACIÓN" required class="w-full p-3 border rounded-xl text-xs"><div class="grid grid-cols-2 gap-2"><select name="cat" class="p-3 border rounded-xl text-[8px]"><option>Sangre</option><option>Farmacia</option><option>Insumo</option></select><select name="tp" onchange="const p=document.getElementById('p_in'); p.disabled=(this.value==='Donacion'); p.value='0.00';" class="p-3 border rounded-xl text-[8px]"><option value="Donacion">Donación</option><option value="Venta">Venta</option></select></div><input id="p_in" name="precio" type="number" step="0.01" value="0.00" disabled class="w-full p-3 border rounded-xl text-xs"></div></div><div id="map"></div><input type="hidden" id="lt" name="lat"><input type="hidden" id="lg" name="lng"><input id="dir" name="dir" readonly placeholder="DA CLIC EN MAPA PARA UBICAR" class="w-full p-3 bg-blue-50 border-none rounded-xl text-[8px] text-brand italic"><button class="w-full btn-medical py-4 text-sm shadow-lg">Certificar Recurso</button></form></div></div><script>var map=L.map('map').setView([19.43,-99.13],12); L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png').addTo(map); var m; map.on('click',function(e){ if(m)map.removeLayer(m); m=L.marker(e.latlng).addTo(map); document.getElementById('lt').value=e.latlng.lat; document.getElementById('lg').value=e.latlng.lng; fetch(`https://nominatim.openstreetmap.org/reverse?format=json&lat=${e.latlng.lat}&lon=${e.latlng.lng}`).then(r=>r.json()).then(d=>document.getElementById('dir').value=d.display_name); });</script>{% endblock %}""",
-    'search.html': """{% extends "base.html" %}{% block content %}<div class="max-w-6xl mx-auto py-10 px-4 uppercase font-black"><h2>Explorar Red</h2><div class="grid md:grid-cols-3 gap-6 mt-8">{% for item in resultados %}<div class="bg-white rounded-2xl border shadow-sm overflow-hidden group"><img src="{{ item.imagen_url }}" class="w-full h-40 object-cover grayscale group-hover:grayscale-0"><div class="p-4"><p class="text-xs">{{ item.nombre }}</p><p class="text-[7px] text-brand">{{ item.categoria }}</p><div class="flex justify-between items-center mt-4"><p class="text-sm">{% if item.precio > 0 %} ${{ item.precio }} {% else %} GRATIS {% endif %}</p><a href="{{ url_for('confirmar_compra', id=item.id_oferta_insumo) }}" class="text-brand"><i class="fas fa-arrow-right"></i></a></div></div></div>{% endfor %}</div></div>{% endblock %}""",
-    'chat.html': """{% extends "base.html" %}{% block content %}<div class="max-w-2xl mx-auto py-6 h-[70vh] flex flex-col"><div class="bg-brand p-4 text-white rounded-t-2xl flex justify-between items-center"><p class="text-[9px] uppercase">Línea de Coordinación</p><a href="{{ url_for('dashboard') }}"><i class="fas fa-times text-xs"></i></a></div><div id="chat-box" class="flex-1 bg-white border-x p-6 overflow-y-auto space-y-4"></div><div class="p-4 bg-white border rounded-b-2xl flex gap-3"><input id="mi" placeholder="Escribir..." class="flex-1 p-3 bg-slate-50 rounded-xl text-[9px] outline-none italic"><button onclick="send()" class="bg-brand text-white w-10 h-10 rounded-xl shadow-lg hover:scale-110 transition-transform"><i class="fas fa-paper-plane"></i></button></div></div><script>const s=io(); const r="{{ solicitud.id_solicitud }}"; const u="{{ current_user.nombre }}"; s.emit('join',{room:r}); s.on('nuevo_mensaje',function(d){ const box=document.getElementById('chat-box'); const isMe=d.user===u; const div=document.createElement('div'); div.className=`flex ${isMe?'justify-end':'justify-start'}`; div.innerHTML=`<div class="${isMe?'bg-brand text-white':'bg-slate-100 text-slate-700'} p-3 rounded-xl max-w-[85%] text-[8px] shadow-sm italic"><p class="font-black mb-1 opacity-50 uppercase">${d.user}</p><p class="uppercase font-bold">${d.msg}</p></div>`; box.appendChild(div); box.scrollTop=box.scrollHeight; }); function send(){ const i=document.getElementById('mi'); if(i.value.trim()){ s.emit('enviar_mensaje',{msg:i.value,room:r}); i.value=''; } }</script>{% endblock %}""",
+    'search.html': """{% extends "base.html" %}{% block content %}<div class="max-w-6xl mx-auto py-10 px-4 uppercase font-black"><h2>Explorar Red</h2><form method="GET" class="grid grid-cols-2 md:grid-cols-6 gap-2 mt-6"><input name="q" value="{{ filtros.q }}" placeholder="BUSCAR RECURSO O ZONA" class="col-span-2 p-3 border rounded-xl text-[8px]"><select name="cat" class="p-3 border rounded-xl text-[8px]"><option value="">CATEGORÍA</option>{% for c in ['Sangre','Farmacia','Insumo'] %}<option {% if filtros.cat == c %}selected{% endif %}>{{ c }}</option>{% endfor %}</select><select name="tp" class="p-3 border rounded-xl text-[8px]"><option value="">TIPO</option><option value="Donacion" {% if filtros.tp == 'Donacion' %}selected{% endif %}>Donación</option><option value="Venta" {% if filtros.tp == 'Venta' %}selected{% endif %}>Venta</option></select><input name="pmin" type="number" step="0.01" value="{{ filtros.pmin }}" placeholder="$ MÍN" class="p-3 border rounded-xl text-[8px]"><input name="pmax" type="number" step="0.01" value="{{ filtros.pmax }}" placeholder="$ MÁX" class="p-3 border rounded-xl text-[8px]"><button class="col-span-2 md:col-span-6 btn-medical py-2 text-[9px]">Filtrar</button></form><div id="resultados" class="grid md:grid-cols-3 gap-6 mt-8">{% for item in resultados %}<div data-id="{{ item.id_oferta_insumo }}" class="bg-white rounded-2xl border shadow-sm overflow-hidden group"><img src="{{ item.imagen_mini_url or item.imagen_url }}" loading="lazy" class="w-full h-40 object-cover grayscale group-hover:grayscale-0"><div class="p-4"><p class="text-xs">{{ item.nombre }}</p><p class="text-[7px] text-brand">{{ item.categoria }}</p><div class="flex justify-between items-center mt-4"><p class="text-sm">{% if item.precio > 0 %} ${{ item.precio }} {% else %} GRATIS {% endif %}</p><a href="{{ url_for('confirmar_compra', id=item.id_oferta_insumo) }}" class="text-brand"><i class="fas fa-arrow-right"></i></a></div></div></div>{% endfor %}</div>{% if siguiente %}<div class="text-center mt-8"><a href="{{ url_for('buscar', cursor=siguiente, **filtros) }}" class="btn-medical px-6 py-2 text-[9px]">Ver más</a></div>{% endif %}</div>{% if not filtros.q and not request.args.cursor %}<script>(function(){ const s=io(); const f={{ filtros|tojson }}; let v={{ version }}; const grid=document.getElementById('resultados'); const ir="{{ url_for('confirmar_compra', id=0) }}".slice(0,-1); function pasa(p){ return (!f.tp||p.tipo===f.tp)&&(!f.pmin||p.precio>=+f.pmin)&&(!f.pmax||p.precio<=+f.pmax); } function tarjeta(p){ const d=document.createElement('div'); d.className='bg-white rounded-2xl border shadow-sm overflow-hidden group'; d.dataset.id=p.id; d.innerHTML=`<img loading="lazy" class="w-full h-40 object-cover grayscale group-hover:grayscale-0"><div class="p-4"><p class="text-xs"></p><p class="text-[7px] text-brand"></p><div class="flex justify-between items-center mt-4"><p class="text-sm"></p><a class="text-brand"><i class="fas fa-arrow-right"></i></a></div></div>`; d.querySelector('img').src=p.imagen_mini_url||p.imagen_url; const t=d.querySelectorAll('p'); t[0].textContent=p.nombre; t[1].textContent=p.categoria; t[2].textContent=p.precio>0?' $'+p.precio+' ':' GRATIS '; d.querySelector('a').href=ir+p.id; return d; } function suscribir(){ s.emit('suscribir_catalogo',{cat:f.cat||null,version:v}); } s.on('connect',suscribir); s.on('catalogo_delta',function(m){ v=Math.max(v,m.version); m.cambios.forEach(function(c){ const previa=grid.querySelector(`[data-id="${c.id}"]`); if(c.op==='baja'||!pasa(c.pub)){ if(previa) previa.remove(); return; } if(previa) previa.replaceWith(tarjeta(c.pub)); else if(c.op==='alta') grid.prepend(tarjeta(c.pub)); }); if(m.mas) suscribir(); }); })();</script>{% endif %}{% endblock %}""",
+    'chat.html': """{% extends "base.html" %}{% block content %}<div class="max-w-2xl mx-auto py-6 h-[70vh] flex flex-col"><div class="bg-brand p-4 text-white rounded-t-2xl flex justify-between items-center"><p class="text-[9px] uppercase">Línea de Coordinación</p><a href="{{ url_for('dashboard') }}"><i class="fas fa-times text-xs"></i></a></div><div id="chat-box" class="flex-1 bg-white border-x p-6 overflow-y-auto space-y-4"><button id="mas" onclick="s.emit('historial',{room:r,cursor:cur})" class="hidden w-full text-[7px] text-slate-400 uppercase">Ver anteriores</button></div><div class="p-4 bg-white border rounded-b-2xl flex gap-3"><input id="mi" placeholder="Escribir..." class="flex-1 p-3 bg-slate-50 rounded-xl text-[9px] outline-none italic"><button onclick="send()" class="bg-brand text-white w-10 h-10 rounded-xl shadow-lg hover:scale-110 transition-transform"><i class="fas fa-paper-plane"></i></button></div></div><script>const s=io(); const r="{{ solicitud.id_solicitud }}"; const u="{{ current_user.nombre }}"; let cur=null; const box=document.getElementById('chat-box'); const mas=document.getElementById('mas'); function burbuja(d){ const isMe=d.user===u; const div=document.createElement('div'); div.className=`flex ${isMe?'justify-end':'justify-start'}`; div.innerHTML=`<div class="${isMe?'bg-brand text-white':'bg-slate-100 text-slate-700'} p-3 rounded-xl max-w-[85%] text-[8px] shadow-sm italic"><p class="font-black mb-1 opacity-50 uppercase"></p><p class="uppercase font-bold"></p></div>`; div.querySelectorAll('p')[0].textContent=d.user; div.querySelectorAll('p')[1].textContent=d.msg; return div; } s.emit('join',{room:r}); s.on('historial',function(h){ h.mensajes.forEach(function(d){ mas.after(burbuja(d)); }); if(cur===null) box.scrollTop=box.scrollHeight; cur=h.siguiente; mas.classList.toggle('hidden', cur===null); }); s.on('nuevo_mensaje',function(d){ box.appendChild(burbuja(d)); box.scrollTop=box.scrollHeight; }); function send(){ const i=document.getElementById('mi'); if(i.value.trim()){ s.emit('enviar_mensaje',{msg:i.value,room:r}); i.value=''; } }</script>{% endblock %}""",
     'perfil.html': """{% extends "base.html" %}{% block content %}<div class="max-w-2xl mx-auto py-16 text-center uppercase italic font-black"><div class="w-24 h-24 bg-brand text-white text-4xl rounded-2xl flex items-center justify-center mx-auto mb-6 shadow-xl">{{ current_user.nombre[0] | upper }}</div><h2>{{ current_user.nombre }}</h2><p class="text-brand text-[8px] tracking-widest mt-2 uppercase">Nodo Verificado LifeLink</p><div class="grid grid-cols-2 gap-4 text-left mt-10"><div class="bg-white p-4 rounded-xl border"><p class="text-[6px] text-slate-300">WHATSAPP</p><p class="text-[9px]">{{ current_user.telefono }}</p></div><div class="bg-white p-4 rounded-xl border"><p class="text-[6px] text-slate-300">EMAIL</p><p class="text-[9px]">{{ current_user.email }}</p></div><div class="bg-white p-4 rounded-xl border col-span-2 text-center"><p class="text-[6px] text-slate-300">UBICACIÓN OPERATIVA</p><p class="text-[9px]">{{ current_user.ubicacion }}</p></div></div><a href="{{ url_for('editar_perfil') }}" class="btn-medical px-6 py-2 text-[9px] mt-8 inline-block shadow-lg">Editar Datos</a></div>{% endblock %}""",
     'editar_perfil.html': """{% extends "base.html" %}{% block content %}<div class="max-w-md mx-auto py-16 px-4 uppercase font-black italic"><div class="bg-white p-10 rounded-3xl shadow-xl border"><h2>Actualizar Datos</h2><form method="POST" class="mt-8 space-y-4"><input name="n" value="{{ current_user.nombre }}" class="w-full p-4 border rounded-xl text-xs"><input name="t" value="{{ current_user.telefono }}" class="w-full p-4 border rounded-xl text-xs"><input name="u" value="{{ current_user.ubicacion }}" class="w-full p-4 border rounded-xl text-xs"><button class="w-full btn-medical py-4 text-sm mt-4">Guardar Cambios</button></form></div></div>{% endblock %}""",
     'soporte.html': """{% extends "base.html" %}{% block content %}<div class="max-w-md mx-auto py-16 text-center uppercase font-black italic"><h2>Soporte Técnico</h2><p class="text-[8px] text-slate-400 mt-2">Mensaje directo al Administrador Maestro</p><form method="POST" class="mt-8 space-y-4"><textarea name="m" placeholder="Describe tu problema..." required class="w-full p-4 border rounded-2xl text-[9px] h-32 shadow-inner outline-none"></textarea><button class="w-full btn-medical py-4 text-sm shadow-lg">Enviar Ticket</button></form></div>{% endblock %}""",
@@ -269,20 +504,675 @@ app.jinja_loader = jinja2.DictLoader({
     'reglas.html': """{% extends "base.html" %}{% block content %}<div class="max-w-3xl mx-auto py-12 px-4 uppercase font-black italic"><h2>Reglas de la Red</h2><div class="bg-white p-8 rounded-3xl border text-[8px] leading-relaxed space-y-4 mt-6"><div><p class="text-brand">VALIDACIÓN</p><p>Cada recurso publicado debe ser real y contar con evidencia fotográfica. El mal uso de la red resultará en baja inmediata del nodo.</p></div></div></div>{% endblock %}"""
 })
 
+# --- CACHÉ DE PLANTILLAS, FRAGMENTOS Y PÁGINAS ESTÁTICAS ---
+# Bytecode de Jinja en disco: los procesos nuevos no vuelven a compilar las plantillas
+os.makedirs(os.path.join(app.instance_path, 'jinja_cache'), exist_ok=True)
+app.jinja_options = dict(app.jinja_options, bytecode_cache=jinja2.FileSystemBytecodeCache(os.path.join(app.instance_path, 'jinja_cache')))
+MAX_FRAGMENTOS = 1024
+_fragmentos = OrderedDict()
+
+@app.template_global()
+def fragmento(nombre, por_usuario=True):
+    # navbar renderizado una vez por estado de autenticación (y nombre visible); footer, una sola vez
+    autenticado = por_usuario and current_user.is_authenticated
+    clave = (nombre, autenticado, current_user.nombre if autenticado else None)
+    html = _fragmentos.get(clave)
+    if html is None:
+        html = _fragmentos[clave] = Markup(render_template(nombre))
+        if len(_fragmentos) > MAX_FRAGMENTOS: _fragmentos.popitem(last=False)
+    else: _fragmentos.move_to_end(clave)
+    return html
+
+_paginas = {}
+INICIO_PROCESO = datetime.utcnow().replace(microsecond=0)
+
+def pagina_estatica(vista):
+    # Para visitantes anónimos sirve la página ya renderizada, con ETag/Last-Modified y 304
+    @functools.wraps(vista)
+    def envoltura(*a, **kw):
+        if current_user.is_authenticated or session.get('_flashes'): return vista(*a, **kw)
+        clave = (request.endpoint, tuple(sorted(kw.items())))
+        if clave not in _paginas:
+            cuerpo = vista(*a, **kw).encode('utf-8')
+            _paginas[clave] = (cuerpo, hashlib.sha1(cuerpo).hexdigest())
+        cuerpo, etag = _paginas[clave]
+        resp = make_response(cuerpo)
+        resp.set_etag(etag); resp.last_modified = INICIO_PROCESO
+        resp.headers['Cache-Control'] = 'no-cache'; resp.vary.add('Cookie')
+        return resp.make_conditional(request)
+    return envoltura
+
+# --- BÚSQUEDA DE CATÁLOGO (índice de texto + cursor) ---
+POR_PAGINA, MAX_POR_PAGINA = 24, 100
+
+def instalar_indice_texto():
+    # SQLite: tabla FTS5 espejo de items_v6 sincronizada por triggers. Postgres: índice trigram.
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as cx:
+            nueva = not cx.execute(text("SELECT 1 FROM sqlite_master WHERE name='items_v6_fts'")).first()
+            cx.exec_driver_sql("CREATE VIRTUAL TABLE IF NOT EXISTS items_v6_fts USING fts5(nombre, direccion_text, content='items_v6', content_rowid='id_oferta_insumo')")
+            cx.exec_driver_sql("CREATE TRIGGER IF NOT EXISTS items_v6_fts_ai AFTER INSERT ON items_v6 BEGIN INSERT INTO items_v6_fts(rowid, nombre, direccion_text) VALUES (new.id_oferta_insumo, new.nombre, new.direccion_text); END")
+            cx.exec_driver_sql("CREATE TRIGGER IF NOT EXISTS items_v6_fts_ad AFTER DELETE ON items_v6 BEGIN INSERT INTO items_v6_fts(items_v6_fts, rowid, nombre, direccion_text) VALUES ('delete', old.id_oferta_insumo, old.nombre, old.direccion_text); END")
+            cx.exec_driver_sql("CREATE TRIGGER IF NOT EXISTS items_v6_fts_au AFTER UPDATE ON items_v6 BEGIN INSERT INTO items_v6_fts(items_v6_fts, rowid, nombre, direccion_text) VALUES ('delete', old.id_oferta_insumo, old.nombre, old.direccion_text); INSERT INTO items_v6_fts(rowid, nombre, direccion_text) VALUES (new.id_oferta_insumo, new.nombre, new.direccion_text); END")
+            if nueva: cx.exec_driver_sql("INSERT INTO items_v6_fts(items_v6_fts) VALUES ('rebuild')")
+    elif db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as cx:
+            cx.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cx.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_items_texto_trgm ON items_v6 USING gin ((nombre || ' ' || coalesce(direccion_text, '')) gin_trgm_ops)")
+
+def filtro_texto(q):
+    # Devuelve la condición SQL de búsqueda libre sobre nombre/direccion_text según el motor
+    if db.engine.dialect.name == 'sqlite':
+        terminos = ' '.join('"%s"*' % t.replace('"', '') for t in q.split() if t.replace('"', ''))
+        if not terminos: return None
+        sub = text("SELECT rowid FROM items_v6_fts WHERE items_v6_fts MATCH :q").bindparams(q=terminos).columns(column('rowid'))
+        return Publicacion.id_oferta_insumo.in_(sub)
+    return (Publicacion.nombre + ' ' + db.func.coalesce(Publicacion.direccion_text, '')).ilike('%' + q + '%')
+
+def filtrar_catalogo(consulta, args):
+    # Aplica los filtros comunes del catálogo (categoría, tipo, rango de precio y texto libre)
+    if args.get('cat'): consulta = consulta.filter(Publicacion.categoria == args['cat'])
+    if args.get('tp'): consulta = consulta.filter(Publicacion.tipo_publicacion == args['tp'])
+    pmin, pmax = args.get('pmin', type=float), args.get('pmax', type=float)
+    if pmin is not None: consulta = consulta.filter(Publicacion.precio >= pmin)
+    if pmax is not None: consulta = consulta.filter(Publicacion.precio <= pmax)
+    q = (args.get('q') or '').strip()
+    if q:
+        cond = filtro_texto(q)
+        if cond is not None: consulta = consulta.filter(cond)
+    return consulta
+
+def pagina_catalogo(consulta, args):
+    # Paginación por cursor (keyset) sobre la PK descendente: el costo depende del tamaño de página
+    limite = min(max(args.get('n', POR_PAGINA, type=int), 1), MAX_POR_PAGINA)
+    cursor = args.get('cursor', type=int)
+    if cursor: consulta = consulta.filter(Publicacion.id_oferta_insumo < cursor)
+    filas = consulta.order_by(Publicacion.id_oferta_insumo.desc()).limit(limite + 1).all()
+    siguiente = filas[limite - 1].id_oferta_insumo if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+def publicacion_dict(p):
+    return {'id': p.id_oferta_insumo, 'nombre': p.nombre, 'categoria': p.categoria, 'tipo': p.tipo_publicacion, 'precio': p.precio, 'imagen_url': p.imagen_url, 'imagen_mini_url': p.imagen_mini_url, 'lat': p.latitud, 'lng': p.longitud, 'direccion': p.direccion_text}
+
+# --- BÚSQUEDA GEOGRÁFICA (rejilla indexada) ---
+TAM_CELDA = 0.1  # grados por celda (~11 km de latitud)
+RADIO_TIERRA_KM = 6371.0
+RADIO_MAX_KM = 500.0
+RADIO_INICIAL_KM = 1.0
+
+def celda(grados): return int(math.floor(grados / TAM_CELDA))
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    # Haversine; sólo se evalúa sobre los candidatos que devuelve el índice de celdas
+    dlat, dlng = math.radians(lat2 - lat1), math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
+
+@event.listens_for(Publicacion, 'before_insert')
+@event.listens_for(Publicacion, 'before_update')
+def asignar_celda(mapper, cx, p):
+    p.celda_lat = celda(p.latitud) if p.latitud is not None else None
+    p.celda_lng = celda(p.longitud) if p.longitud is not None else None
+
+MARGEN_APROXIMACION = 2  # candidatos por resultado pedido al ordenar por distancia aproximada en SQL
+
+def en_radio(consulta, lat, lng, radio_km, limite=None):
+    # Candidatos por celdas (índice ix_items_celda_lat: una búsqueda por celda) + caja envolvente; luego distancia exacta.
+    # Con límite, la base ordena por distancia equirectangular y devuelve sólo los primeros candidatos:
+    # la caja nunca se materializa completa en Python.
+    coseno = max(math.cos(math.radians(lat)), 0.01)
+    dlat = radio_km / 111.32
+    dlng = radio_km / (111.32 * coseno)
+    consulta = consulta.filter(
+        Publicacion.celda_lat.in_(list(range(celda(lat - dlat), celda(lat + dlat) + 1))),
+        Publicacion.celda_lng.in_(list(range(celda(lng - dlng), celda(lng + dlng) + 1))),
+        Publicacion.latitud.between(lat - dlat, lat + dlat),
+        Publicacion.longitud.between(lng - dlng, lng + dlng))
+    if limite:
+        aprox = (Publicacion.latitud - lat) * (Publicacion.latitud - lat) + (Publicacion.longitud - lng) * (Publicacion.longitud - lng) * (coseno * coseno)
+        consulta = consulta.order_by(aprox).limit(limite * MARGEN_APROXIMACION)
+    res = sorted(((distancia_km(lat, lng, p.latitud, p.longitud), p) for p in consulta), key=lambda t: t[0])
+    res = [t for t in res if t[0] <= radio_km]
+    return res[:limite] if limite else res
+
+def mas_cercanos(consulta, lat, lng, n, radio_max_km=RADIO_MAX_KM):
+    # Radio creciente: si hay n resultados dentro del radio r, son los n más cercanos. Cada paso lee a lo
+    # sumo MARGEN_APROXIMACION * n filas, así que el costo depende de n y de la densidad local, no del total.
+    radio = min(RADIO_INICIAL_KM, radio_max_km)
+    while True:
+        res = en_radio(consulta, lat, lng, radio, n)
+        if len(res) >= n or radio >= radio_max_km: return res
+        radio = min(radio * 4, radio_max_km)
+
+# --- EMPAREJAMIENTO DE DONANTES (compatibilidad ABO/Rh) ---
+# Receptor -> tipos de donante compatibles (glóbulos rojos), precalculado al cargar el módulo
+COMPATIBLES = {
+    'O-': ('O-',),
+    'O+': ('O-', 'O+'),
+    'A-': ('O-', 'A-'),
+    'A+': ('O-', 'O+', 'A-', 'A+'),
+    'B-': ('O-', 'B-'),
+    'B+': ('O-', 'O+', 'B-', 'B+'),
+    'AB-': ('O-', 'A-', 'B-', 'AB-'),
+    'AB+': ('O-', 'O+', 'A-', 'A+', 'B-', 'B+', 'AB-', 'AB+'),
+}
+
+def normalizar_ubicacion(txt):
+    # "Ciudad de México " -> "CIUDAD DE MEXICO": clave de búsqueda estable para el índice
+    txt = unicodedata.normalize('NFKD', txt or '')
+    return ' '.join(''.join(c for c in txt if not unicodedata.combining(c)).upper().split()) or None
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def asignar_ubicacion_norm(mapper, cx, u): u.ubicacion_norm = normalizar_ubicacion(u.ubicacion)
+
+def donantes_compatibles(receptor, ciudad, cursor=None, limite=POR_PAGINA):
+    # Un recorrido ordenado de ix_users_ubic_sangre_id por tipo compatible (igualdad en ciudad y tipo, rango
+    # en id, LIMIT) y la unión de a lo sumo 8 x (limite + 1) ids se ordena por PK: nunca se ordena toda la ciudad
+    ubicacion = normalizar_ubicacion(ciudad)
+    por_tipo = [db.select(User.id).where(User.ubicacion_norm == ubicacion, User.tipo_sangre == t, User.id > (cursor or 0)).order_by(User.id).limit(limite + 1).subquery()
+                for t in COMPATIBLES[receptor]]
+    ids = db.union_all(*[db.select(sub.c.id) for sub in por_tipo]).subquery()
+    filas = User.query.filter(User.id.in_(db.select(ids.c.id))).order_by(User.id).limit(limite + 1).all()
+    siguiente = filas[limite - 1].id if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+# --- INGESTA DE IMÁGENES EN SEGUNDO PLANO ---
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # sin Pillow se valida la firma del archivo y se sube sin redimensionar
+    Image = None
+
+IMAGEN_PENDIENTE = "https://via.placeholder.com/400"
+MEDIA_DIR = os.environ.get('MEDIA_DIR') or os.path.join(app.instance_path, 'media')
+TAM_MAX_IMAGEN, TAM_MINIATURA = 1600, 400
+WORKERS_MEDIA = int(os.environ.get('MEDIA_WORKERS', 4))
+REINTENTOS_MEDIA, ESPERA_BASE_MEDIA = 5, 2.0  # intentos de subida; espera 2, 4, 8, 16 s
+ANTIGUEDAD_PENDIENTE = 3600  # s: pasado esto, un pendiente de otra máquina se considera huérfano
+HOST_MEDIA = socket.gethostname().split('.')[0]
+FIRMAS_IMAGEN = {b'\xff\xd8\xff': 'jpg', b'\x89PNG': 'png', b'GIF8': 'gif', b'RIFF': 'webp'}
+
+class AlmacenLocal:
+    # Sistema de archivos local servido por /media/<nombre>; funciona sin red
+    def __init__(self, raiz, url_base='/media/'):
+        self.raiz, self.url_base = raiz, url_base
+        os.makedirs(raiz, exist_ok=True)
+    def subir(self, datos, nombre):
+        with open(os.path.join(self.raiz, nombre), 'wb') as f: f.write(datos)
+        return self.url_base + nombre
+
+class AlmacenCloudinary:
+    def subir(self, datos, nombre):
+        return cloudinary.uploader.upload(io.BytesIO(datos), public_id=os.path.splitext(nombre)[0])['secure_url']
+
+def crear_almacen(backend=None):
+    # MEDIA_BACKEND=local|cloudinary; por defecto Cloudinary sólo si hay credenciales
+    backend = backend or os.environ.get('MEDIA_BACKEND') or ('cloudinary' if os.environ.get('CLOUDINARY_CLOUD_NAME') else 'local')
+    return AlmacenCloudinary() if backend == 'cloudinary' else AlmacenLocal(os.path.join(MEDIA_DIR, 'publicas'))
+
+def preparar_imagen(datos):
+    # Valida y genera [(sufijo, bytes, extensión)] para imagen completa y miniatura (CPU: corre en tpool)
+    if Image is None:
+        ext = next((e for firma, e in FIRMAS_IMAGEN.items() if datos.startswith(firma)), None)
+        if not ext: raise ValueError('El archivo no es una imagen soportada')
+        return [('', datos, ext), ('_mini', datos, ext)]
+    with Image.open(io.BytesIO(datos)) as im: im.verify()
+    with Image.open(io.BytesIO(datos)) as im: base = ImageOps.exif_transpose(im).convert('RGB')
+    salidas = []
+    for sufijo, lado in (('', TAM_MAX_IMAGEN), ('_mini', TAM_MINIATURA)):
+        copia, buf = base.copy(), io.BytesIO()
+        copia.thumbnail((lado, lado)); copia.save(buf, 'JPEG', quality=85, optimize=True)
+        salidas.append((sufijo, buf.getvalue(), 'jpg'))
+    return salidas
+
+# Pendientes: '<id_pub>_<hex>@<host>-<pid>' mientras un proceso los tiene en su cola;
+# '<id_pub>_<hex>' (sin dueño) cuando se agotaron los reintentos y esperan al siguiente arranque.
+def dueno_media(): return '%s-%d' % (HOST_MEDIA, os.getpid())
+
+def dueno_vivo(dueno, mtime):
+    # En la misma máquina se pregunta al sistema por el pid; en otra, sólo la antigüedad lo delata
+    host, _, pid = dueno.rpartition('-')
+    if host != HOST_MEDIA or not pid.isdigit(): return time.time() - mtime < ANTIGUEDAD_PENDIENTE
+    if int(pid) == os.getpid(): return False  # sólo se consulta al arrancar: es de una vida anterior de este pid
+    try: os.kill(int(pid), 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
+
+def borrar_pendiente(ruta):
+    try: os.remove(ruta)
+    except FileNotFoundError: pass
+
+def guardar_pendiente(archivo, id_pub):
+    # El archivo crudo queda en disco, a nombre de este proceso, hasta que el worker lo procese con éxito
+    os.makedirs(os.path.join(MEDIA_DIR, 'pendientes'), exist_ok=True)
+    ruta = os.path.join(MEDIA_DIR, 'pendientes', '%d_%s@%s' % (id_pub, uuid.uuid4().hex, dueno_media()))
+    archivo.save(ruta + '.parcial'); os.replace(ruta + '.parcial', ruta)  # recuperar_pendientes nunca ve un archivo a medias
+    return ruta
+
+class ColaMedia:
+    # Pool de workers verdes sobre una cola en memoria, con reintentos y backoff exponencial
+    def __init__(self, almacen, workers=WORKERS_MEDIA):
+        self.almacen, self.workers, self.cola, self.iniciada = almacen, workers, queue.Queue(), False
+        self.metricas = {'encolados': 0, 'procesados': 0, 'reintentos': 0, 'fallidos': 0, 'rechazados': 0, 'en_espera': 0, 'ejecuciones': 0, 'segundos_total': 0.0, 'segundos_max': 0.0}
+
+    def encolar(self, id_pub, ruta, intento=0):
+        if not self.iniciada:
+            self.iniciada = True
+            for _ in range(self.workers): socketio.start_background_task(self._worker)
+        if intento == 0: self.metricas['encolados'] += 1
+        self.cola.put((id_pub, ruta, intento))
+
+    def estado(self):
+        m = self.metricas
+        return dict(m, profundidad=self.cola.qsize(), segundos_promedio=m['segundos_total'] / max(m['ejecuciones'], 1))
+
+    def _worker(self):
+        while True:
+            trabajo = self.cola.get()
+            t0 = time.perf_counter()
+            try: self.procesar(*trabajo)
+            except Exception: app.logger.exception("Error procesando imagen de la publicación %s", trabajo[0])
+            dt = time.perf_counter() - t0
+            self.metricas['ejecuciones'] += 1; self.metricas['segundos_total'] += dt; self.metricas['segundos_max'] = max(self.metricas['segundos_max'], dt)
+
+    def _reencolar(self, trabajo, espera):
+        socketio.sleep(espera)
+        self.metricas['en_espera'] -= 1
+        self.cola.put(trabajo)
+
+    def recuperar_pendientes(self):
+        # Al arrancar: vuelven a la cola los pendientes sin dueño (reintentos agotados) o cuyo dueño murió
+        # (reinicio). Los de procesos vivos no se tocan. Se reclaman renombrándolos a este proceso: si dos
+        # workers arrancan a la vez, sólo uno gana el rename.
+        carpeta = os.path.join(MEDIA_DIR, 'pendientes')
+        if not os.path.isdir(carpeta): return 0
+        recuperados = 0
+        for nombre in sorted(os.listdir(carpeta)):
+            origen = os.path.join(carpeta, nombre)
+            try: mtime = os.path.getmtime(origen)
+            except FileNotFoundError: continue
+            if nombre.endswith('.parcial'):
+                if time.time() - mtime > ANTIGUEDAD_PENDIENTE: borrar_pendiente(origen)  # subida HTTP interrumpida
+                continue
+            base, _, dueno = nombre.partition('@')
+            id_txt, _, resto = base.partition('_')
+            if not id_txt.isdigit() or not resto or (dueno and dueno_vivo(dueno, mtime)): continue
+            ruta = os.path.join(carpeta, '%s@%s' % (base, dueno_media()))
+            try: os.rename(origen, ruta)
+            except FileNotFoundError: continue
+            self.encolar(int(id_txt), ruta); recuperados += 1
+        if recuperados: app.logger.info("%d imágenes pendientes reencoladas", recuperados)
+        return recuperados
+
+    def procesar(self, id_pub, ruta, intento):
+        try:
+            with open(ruta, 'rb') as f: datos = f.read()
+        except FileNotFoundError:
+            app.logger.warning("Pendiente %s desaparecido antes de procesarse", ruta); return
+        try: versiones = tpool.execute(preparar_imagen, datos)
+        except Exception:
+            # Imagen inválida: no tiene sentido reintentar, la publicación conserva el marcador
+            self.metricas['rechazados'] += 1; borrar_pendiente(ruta); return
+        clave = uuid.uuid4().hex[:8]
+        try: urls = {suf: self.almacen.subir(d, '%d_%s%s.%s' % (id_pub, clave, suf, ext)) for suf, d, ext in versiones}
+        except Exception:
+            if intento + 1 >= REINTENTOS_MEDIA:
+                # Se suelta el archivo (sin dueño): el siguiente arranque lo vuelve a intentar
+                self.metricas['fallidos'] += 1
+                libre = ruta.rsplit('@', 1)[0]
+                try: os.rename(ruta, libre)
+                except FileNotFoundError: libre = ruta
+                app.logger.exception("Subida fallida definitivamente; archivo conservado en %s", libre); return
+            self.metricas['reintentos'] += 1; self.metricas['en_espera'] += 1
+            socketio.start_background_task(self._reencolar, (id_pub, ruta, intento + 1), ESPERA_BASE_MEDIA * 2 ** intento)
+            return
+        with app.app_context():
+            p = db.session.get(Publicacion, id_pub)
+            cambios = []
+            if p:
+                p.imagen_url, p.imagen_mini_url = urls[''], urls['_mini']
+                cambios = registrar_cambios([fila_cambio('cambio', p.id_oferta_insumo, p.categoria, p.celda_lat, p.celda_lng)]); db.session.commit()
+            difundir_cambios(cambios)
+        borrar_pendiente(ruta)
+        self.metricas['procesados'] += 1
+
+cola_media = ColaMedia(crear_almacen())
+
+# --- IMPORTACIÓN / EXPORTACIÓN MASIVA (CSV y NDJSON en streaming) ---
+LOTE_IMPORTACION = 1000      # filas validadas e insertadas por transacción
+MAX_ERRORES_REPORTADOS = 1000
+CATEGORIAS_VALIDAS, TIPOS_VALIDOS = ('Sangre', 'Farmacia', 'Insumo'), ('Donacion', 'Venta')
+COLUMNAS_PUBLICACION = ('id_oferta_insumo', 'id_proveedor', 'nombre', 'categoria', 'tipo_publicacion', 'precio', 'imagen_url', 'latitud', 'longitud', 'direccion_text')
+COLUMNAS_SOLICITUD = ('id_solicitud', 'id_solicitante', 'id_publicacion', 'metodo_pago', 'estatus')
+
+def _texto(d, campo, maximo, defecto=''):
+    v = d.get(campo)
+    if v is None or v == '': return defecto
+    if not isinstance(v, str): raise ValueError('%s debe ser texto' % campo)
+    if len(v) > maximo: raise ValueError('%s admite máx. %d caracteres' % (campo, maximo))
+    return v
+
+def _numero(d, campo, defecto):
+    # Acepta números o texto numérico; rechaza booleanos, NaN e infinitos (la base los guardaría como NULL)
+    v = d.get(campo)
+    if v is None or v == '': return defecto
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)): raise ValueError('%s debe ser numérico' % campo)
+    try: x = float(v)
+    except ValueError: raise ValueError('%s debe ser numérico' % campo)
+    if not math.isfinite(x): raise ValueError('%s debe ser un número finito' % campo)
+    return x
+
+def validar_publicacion(d, id_proveedor):
+    # Devuelve la fila lista para executemany o lanza ValueError con el motivo
+    nombre = _texto(d, 'nombre', 100).strip()
+    if not nombre: raise ValueError('nombre obligatorio (máx. 100 caracteres)')
+    if d.get('categoria') not in CATEGORIAS_VALIDAS: raise ValueError('categoria debe ser una de %s' % ', '.join(CATEGORIAS_VALIDAS))
+    tipo = d.get('tipo_publicacion') or 'Donacion'
+    if tipo not in TIPOS_VALIDOS: raise ValueError('tipo_publicacion debe ser Donacion o Venta')
+    precio = 0.0 if tipo == 'Donacion' else _numero(d, 'precio', 0.0)
+    lat, lng = _numero(d, 'latitud', 19.43), _numero(d, 'longitud', -99.13)
+    if precio < 0: raise ValueError('precio no puede ser negativo')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180): raise ValueError('coordenadas fuera de rango')
+    direccion, imagen = _texto(d, 'direccion_text', 500), _texto(d, 'imagen_url', 500, IMAGEN_PENDIENTE)
+    # executemany no dispara los eventos ORM: la celda geográfica se calcula aquí
+    return {'id_proveedor': id_proveedor, 'nombre': nombre, 'categoria': d['categoria'], 'tipo_publicacion': tipo, 'precio': precio, 'imagen_url': imagen,
+            'latitud': lat, 'longitud': lng, 'direccion_text': direccion, 'celda_lat': celda(lat), 'celda_lng': celda(lng)}
+
+class ImportacionDetenida(ValueError):
+    # El flujo ya no se puede seguir leyendo (codificación inválida, campo CSV enorme): se reporta y se corta
+    pass
+
+def leer_registros(flujo, formato):
+    # Itera (número de fila, dict | error de parseo) sin cargar el archivo completo en memoria
+    if isinstance(flujo, io.TextIOBase): texto = flujo
+    else: texto = io.TextIOWrapper(flujo if hasattr(flujo, 'read1') else io.BufferedReader(flujo), encoding='utf-8-sig', newline='')
+    i = 1 if formato == 'csv' else 0
+    try:
+        if formato == 'csv':
+            lector = csv.DictReader(texto)
+            for fila in lector:
+                i = lector.line_num
+                yield i, fila
+            return
+        for i, linea in enumerate(texto, 1):
+            if not linea.strip(): continue
+            try: yield i, json.loads(linea)
+            except ValueError as e: yield i, ValueError('JSON inválido: %s' % e)
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield i + 1, ImportacionDetenida('importación detenida: %s' % e)
+
+def importar_publicaciones(flujo, formato, id_proveedor):
+    insertadas, errores, omitidos, lote = 0, [], 0, []
+    def volcar():
+        nonlocal insertadas
+        if lote:
+            t = Publicacion.__table__
+            filas = db.session.execute(t.insert().returning(t.c.id_oferta_insumo, t.c.categoria, t.c.celda_lat, t.c.celda_lng), lote).all()
+            cambios = registrar_cambios([fila_cambio('alta', *f) for f in filas]); db.session.commit()
+            difundir_cambios(cambios)
+            insertadas += len(lote); lote.clear()
+    for fila, registro in leer_registros(flujo, formato):
+        try:
+            if isinstance(registro, Exception): raise registro
+            if not isinstance(registro, dict): raise ValueError('cada registro debe ser un objeto')
+            lote.append(validar_publicacion(registro, id_proveedor))
+        except ValueError as e:
+            if len(errores) < MAX_ERRORES_REPORTADOS or isinstance(e, ImportacionDetenida): errores.append({'fila': fila, 'error': str(e)})
+            else: omitidos += 1
+            if isinstance(e, ImportacionDetenida): break
+        if len(lote) >= LOTE_IMPORTACION: volcar()
+    # Siempre se informa lo ya confirmado: el cliente sabe exactamente qué filas quedaron dentro
+    volcar()
+    return {'insertadas': insertadas, 'errores': errores, 'errores_omitidos': omitidos}
+
+def exportar(consulta, columnas, formato):
+    # Cursor del lado del servidor (stream_results + yield_per): memoria constante sin importar el tamaño
+    filas = db.session.execute(consulta.execution_options(stream_results=True, yield_per=LOTE_IMPORTACION))
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    if formato == 'csv': escritor.writerow(columnas)
+    for n, fila in enumerate(filas, 1):
+        if formato == 'csv': escritor.writerow(fila)
+        else: buf.write(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + '\n')
+        if n % LOTE_IMPORTACION == 0:
+            yield buf.getvalue(); buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+def consulta_publicaciones(): return db.select(*[Publicacion.__table__.c[c] for c in COLUMNAS_PUBLICACION]).order_by(Publicacion.id_oferta_insumo)
+
+def consulta_solicitudes(id_proveedor=None):
+    q = db.select(*[Solicitud.__table__.c[c] for c in COLUMNAS_SOLICITUD]).order_by(Solicitud.id_solicitud)
+    if id_proveedor is not None: q = q.join(Publicacion, Publicacion.id_oferta_insumo == Solicitud.id_publicacion).where(Publicacion.id_proveedor == id_proveedor)
+    return q
+
+def formato_solicitado():
+    formato = request.args.get('formato') or ('csv' if 'csv' in (request.mimetype or '') else 'ndjson')
+    if formato not in ('csv', 'ndjson'): abort(400)
+    return formato
+
+def respuesta_exportacion(consulta, columnas, nombre):
+    formato = formato_solicitado()
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(exportar(consulta, columnas, formato)), mimetype=tipo, headers={'Content-Disposition': 'attachment; filename=%s.%s' % (nombre, formato)})
+
+@app.cli.command('importar-publicaciones')
+@click.argument('archivo', type=click.File('rb'))
+@click.option('--proveedor', type=int, required=True, help='id del usuario dueño de las publicaciones')
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), default=None, help='por defecto, según la extensión')
+def cli_importar_publicaciones(archivo, proveedor, formato):
+    """Importa publicaciones desde CSV o NDJSON en lotes."""
+    formato = formato or ('csv' if archivo.name.endswith('.csv') else 'ndjson')
+    r = importar_publicaciones(archivo, formato, proveedor)
+    for e in r['errores']: click.echo('fila %(fila)d: %(error)s' % e, err=True)
+    click.echo('%d insertadas, %d con errores' % (r['insertadas'], len(r['errores']) + r['errores_omitidos']))
+
+@app.cli.command('exportar')
+@click.argument('tabla', type=click.Choice(['publicaciones', 'solicitudes']))
+@click.option('--formato', type=click.Choice(['csv', 'ndjson']), default='ndjson')
+def cli_exportar(tabla, formato):
+    """Exporta publicaciones o solicitudes a la salida estándar."""
+    consulta, columnas = (consulta_publicaciones(), COLUMNAS_PUBLICACION) if tabla == 'publicaciones' else (consulta_solicitudes(), COLUMNAS_SOLICITUD)
+    for trozo in exportar(consulta, columnas, formato): click.echo(trozo, nl=False)
+
+# --- CATÁLOGO EN VIVO (versión, deltas y difusión por Socket.IO) ---
+MAX_CAMBIOS = 500               # cambios por respuesta de /api/catalogo/cambios o de puesta al día
+RADIO_CATALOGO_KM = 50.0        # radio por defecto de una suscripción por zona
+CELDAS_POR_ZONA = 10            # zona de difusión = 10x10 celdas (~1 grado)
+MAX_ZONAS_SUSCRIPCION = 64      # más zonas que esto: se suscribe sin filtro geográfico
+# Huella de las plantillas: un despliegue con HTML distinto invalida los ETag de /buscar
+HUELLA_PLANTILLAS = hashlib.sha1(repr(sorted(app.jinja_loader.mapping.items())).encode('utf-8')).hexdigest()[:12]
+
+def version_catalogo(): return db.session.query(db.func.max(CambioCatalogo.id)).scalar() or 0
+
+def fila_cambio(op, id_publicacion, categoria, celda_lat, celda_lng):
+    return {'op': op, 'id_publicacion': id_publicacion, 'categoria': categoria, 'celda_lat': celda_lat, 'celda_lng': celda_lng}
+
+def registrar_cambios(filas):
+    # Se llama justo antes del commit de la escritura, en la misma transacción. En Postgres el candado
+    # transaccional hace que las versiones se confirmen en orden: un lector de deltas nunca salta una.
+    if not filas: return []
+    if db.engine.dialect.name == 'postgresql': db.session.execute(text('SELECT pg_advisory_xact_lock(7271)'))
+    t = CambioCatalogo.__table__
+    return db.session.execute(t.insert().returning(*t.c), filas).all()
+
+def deltas(cambios):
+    # Forma compacta de cada cambio; altas y cambios llevan la publicación con una sola consulta IN
+    ids = {c.id_publicacion for c in cambios if c.op != 'baja'}
+    pubs = {p.id_oferta_insumo: publicacion_dict(p) for p in Publicacion.query.filter(Publicacion.id_oferta_insumo.in_(ids))} if ids else {}
+    # Una alta cuya publicación ya no existe se entrega como baja
+    return [{'v': c.id, 'op': c.op, 'id': c.id_publicacion, 'pub': pubs[c.id_publicacion]} if c.id_publicacion in pubs and c.op != 'baja'
+            else {'v': c.id, 'op': 'baja', 'id': c.id_publicacion} for c in cambios]
+
+def compactar(lista):
+    # Sólo el último cambio de cada publicación, en orden de versión
+    return sorted({d['id']: d for d in lista}.values(), key=lambda d: d['v'])
+
+def zona(c): return c // CELDAS_POR_ZONA
+
+def alcance(cat, lat, lng, radio_km):
+    # Filtro opcional (categoría y/o círculo) -> (categoría, caja de celdas); ValueError si es inválido
+    if cat and cat not in CATEGORIAS_VALIDAS: raise ValueError('categoria debe ser una de %s' % ', '.join(CATEGORIAS_VALIDAS))
+    if lat is None and lng is None: return cat or None, None
+    try: lat, lng, radio_km = float(lat), float(lng), float(radio_km or RADIO_CATALOGO_KM)
+    except (TypeError, ValueError): raise ValueError('lat, lng y radio_km deben ser numéricos')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radio_km <= 0: raise ValueError('coordenadas o radio fuera de rango')
+    radio_km = min(radio_km, RADIO_MAX_KM)
+    dlat = radio_km / 111.32
+    dlng = radio_km / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+    return cat or None, ((celda(lat - dlat), celda(lat + dlat)), (celda(lng - dlng), celda(lng + dlng)))
+
+def cambios_desde(desde, cat=None, caja=None, limite=MAX_CAMBIOS):
+    # Recorrido por la PK de la bitácora; la versión se lee antes para no saltar cambios concurrentes
+    version = version_catalogo()
+    consulta = CambioCatalogo.query.filter(CambioCatalogo.id > desde, CambioCatalogo.id <= version)
+    if cat: consulta = consulta.filter(CambioCatalogo.categoria == cat)
+    if caja: consulta = consulta.filter(CambioCatalogo.celda_lat.between(*caja[0]), CambioCatalogo.celda_lng.between(*caja[1]))
+    filas = consulta.order_by(CambioCatalogo.id).limit(limite + 1).all()
+    mas = len(filas) > limite
+    filas = filas[:limite]
+    return compactar(deltas(filas)), (filas[-1].id if mas else version), mas
+
+def salas_suscripcion(cat, caja):
+    clave = cat or '*'
+    if caja:
+        zl, zg = range(zona(caja[0][0]), zona(caja[0][1]) + 1), range(zona(caja[1][0]), zona(caja[1][1]) + 1)
+        if len(zl) * len(zg) <= MAX_ZONAS_SUSCRIPCION: return ['catalogo:%s:%d:%d' % (clave, a, b) for a in zl for b in zg]
+    return ['catalogo:' + clave]
+
+def salas_cambio(c):
+    # Cada cambio va a lo sumo a 4 salas (todas/categoría x global/zona): el costo no depende de los suscriptores
+    for clave in ('*', c.categoria):
+        yield 'catalogo:%s' % clave
+        if c.celda_lat is not None and c.celda_lng is not None: yield 'catalogo:%s:%d:%d' % (clave, zona(c.celda_lat), zona(c.celda_lng))
+
+def difundir_cambios(cambios):
+    # Tras el commit: un emit por sala con todos los deltas que le corresponden
+    if not cambios: return
+    salas = {}
+    for c, d in zip(cambios, deltas(cambios)):
+        for sala in salas_cambio(c): salas.setdefault(sala, []).append(d)
+    version = max(c.id for c in cambios)
+    for sala, lista in salas.items(): socketio.emit('catalogo_delta', {'version': version, 'cambios': lista, 'mas': False}, to=sala)
+
+def respuesta_condicional(etag, generar):
+    # 304 sin ejecutar la consulta ni el render si el cliente ya tiene esta versión
+    if request.if_none_match.contains(etag) and not session.get('_flashes'): resp = Response(status=304)
+    else: resp = make_response(generar())
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'; resp.vary.add('Cookie')
+    return resp
+
+# --- ESTADÍSTICAS DE AUDITORÍA (caché con TTL) ---
+TTL_ESTADISTICAS = 60  # segundos
+_estadisticas = {'valor': None, 'expira': 0.0}
+
+def estadisticas_globales():
+    # Los COUNT(*) sobre tablas completas se recalculan como máximo una vez por TTL
+    ahora = time.monotonic()
+    if _estadisticas['valor'] is None or ahora >= _estadisticas['expira']:
+        _estadisticas['valor'] = {'total_usuarios': User.query.count(), 'total_publicaciones': Publicacion.query.count(), 'total_tickets': Ticket.query.count()}
+        _estadisticas['expira'] = ahora + TTL_ESTADISTICAS
+    return _estadisticas['valor']
+
+# --- HASH DE CONTRASEÑAS FUERA DEL HUB ---
+# scrypt/PBKDF2 es CPU puro: ejecutado en el hub de eventlet congela todos los sockets. Se delega
+# a los hilos nativos de tpool, con un semáforo verde que limita la concurrencia y encola el resto.
+HASH_CONCURRENCIA = int(os.environ.get('HASH_CONCURRENCIA', 4))
+_sem_hash = threading.BoundedSemaphore(HASH_CONCURRENCIA)
+
+def hash_password(password):
+    with _sem_hash: return tpool.execute(generate_password_hash, password)
+
+def verificar_password(password_hash, password):
+    with _sem_hash: return tpool.execute(check_password_hash, password_hash, password)
+
+# --- CACHÉ DE IDENTIDADES (user_loader) ---
+TTL_IDENTIDAD = int(os.environ.get('TTL_IDENTIDAD', 300))        # segundos
+MAX_IDENTIDADES = int(os.environ.get('MAX_IDENTIDADES', 10000))
+
+class UsuarioSesion:
+    # Instantánea ligera y desligada de la sesión ORM con los campos que usan vistas, plantillas y sockets
+    __slots__ = ('id', 'nombre', 'email', 'telefono', 'tipo_sangre', 'ubicacion')
+    is_authenticated, is_active, is_anonymous = True, True, False
+
+    def __init__(self, u):
+        for campo in self.__slots__: setattr(self, campo, getattr(u, campo))
+
+    def get_id(self): return str(self.id)
+
+class CacheIdentidades:
+    # LRU con TTL; editar_perfil invalida la entrada. Entre workers la TTL acota la desactualización.
+    def __init__(self, maximo=MAX_IDENTIDADES, ttl=TTL_IDENTIDAD):
+        self.maximo, self.ttl = maximo, ttl
+        self.entradas, self.lock = OrderedDict(), threading.Lock()
+        self.aciertos = self.fallos = 0
+
+    def obtener(self, u_id):
+        ahora = time.monotonic()
+        with self.lock:
+            entrada = self.entradas.get(u_id)
+            if entrada and entrada[1] > ahora:
+                self.entradas.move_to_end(u_id); self.aciertos += 1
+                return entrada[0]
+            self.fallos += 1
+        u = db.session.get(User, u_id)
+        if u is None: return None
+        snap = UsuarioSesion(u)
+        with self.lock:
+            self.entradas[u_id] = (snap, ahora + self.ttl); self.entradas.move_to_end(u_id)
+            while len(self.entradas) > self.maximo: self.entradas.popitem(last=False)
+        return snap
+
+    def invalidar(self, u_id):
+        with self.lock: self.entradas.pop(u_id, None)
+
+    def estado(self):
+        total = self.aciertos + self.fallos
+        return {'entradas': len(self.entradas), 'maximo': self.maximo, 'ttl': self.ttl, 'aciertos': self.aciertos, 'fallos': self.fallos, 'tasa_aciertos': self.aciertos / total if total else 0.0}
+
+cache_identidades = CacheIdentidades()
+
 # --- ASEGURAR TABLAS Y ADMIN ---
+# Índices reemplazados: si siguen en bases previas el planificador puede preferirlos y ordenar en memoria
+INDICES_OBSOLETOS = ('ix_items_cat_tipo_precio', 'ix_items_celda')
+
+def asegurar_columnas():
+    # create_all no altera tablas existentes: agrega las columnas nuevas (nullable) a bases previas
+    insp = db.inspect(db.engine)
+    for tabla in db.metadata.sorted_tables:
+        if not insp.has_table(tabla.name): continue
+        existentes = {c['name'] for c in insp.get_columns(tabla.name)}
+        for col in tabla.columns:
+            if col.name not in existentes:
+                with db.engine.begin() as cx: cx.exec_driver_sql('ALTER TABLE %s ADD COLUMN %s %s' % (tabla.name, col.name, col.type.compile(db.engine.dialect)))
+
 with app.app_context():
     db.create_all()
+    asegurar_columnas()
+    # create_all tampoco agrega índices a tablas ya existentes
+    for tabla in db.metadata.sorted_tables:
+        for ix in tabla.indexes: ix.create(db.engine, checkfirst=True)
+    with db.engine.begin() as cx:
+        for nombre in INDICES_OBSOLETOS: cx.exec_driver_sql('DROP INDEX IF EXISTS %s' % nombre)
+    instalar_indice_texto()
+    # Precompilación de todas las plantillas (llena la caché en memoria y la de bytecode)
+    for nombre in app.jinja_loader.list_templates(): app.jinja_env.get_template(nombre)
+    for p in Publicacion.query.filter(Publicacion.celda_lat.is_(None), Publicacion.latitud.isnot(None)): asignar_celda(None, None, p)
+    for u in User.query.filter(User.ubicacion_norm.is_(None), User.ubicacion.isnot(None)): asignar_ubicacion_norm(None, None, u)
+    db.session.commit()
     if not User.query.filter_by(email='admin@lifelink.com').first():
-        admin = User(nombre="ADMINISTRADOR MAESTRO", email="admin@lifelink.com", telefono="0000000000", tipo_sangre="AB+", ubicacion="NODO CENTRAL HQ", password_hash=generate_password_hash("admin123"))
+        admin = User(nombre="ADMINISTRADOR MAESTRO", email="admin@lifelink.com", telefono="0000000000", tipo_sangre="AB+", ubicacion="NODO CENTRAL HQ", password_hash=hash_password("admin123"))
         db.session.add(admin); db.session.commit()
 
 # ==========================================
 # 3. RUTAS DE CONTROL
 # ==========================================
 @login_manager.user_loader
-def load_user(u_id): return User.query.get(int(u_id))
+def load_user(u_id): return cache_identidades.obtener(int(u_id))
 
 @app.route('/')
+@pagina_estatica
 def index(): return render_template('home.html')
 
 @app.route('/registro', methods=['GET', 'POST'])
@@ -290,7 +1180,7 @@ def registro():
     if request.method == 'POST':
         if User.query.filter_by(email=request.form['email']).first(): flash("Correo ya registrado.")
         else:
-            u = User(nombre=request.form['nombre'], email=request.form['email'], telefono=request.form['tel'], tipo_sangre=request.form['sangre'], ubicacion=request.form['ub'], password_hash=generate_password_hash(request.form['pass']))
+            u = User(nombre=request.form['nombre'], email=request.form['email'], telefono=request.form['tel'], tipo_sangre=request.form['sangre'], ubicacion=request.form['ub'], password_hash=hash_password(request.form['pass']))
             db.session.add(u); db.session.commit(); login_user(u); return redirect(url_for('dashboard'))
     return render_template('register.html')
 
@@ -298,7 +1188,7 @@ def registro():
 def login():
     if request.method == 'POST':
         u = User.query.filter_by(email=request.form['email']).first()
-        if u and check_password_hash(u.password_hash, request.form['password']): login_user(u); return redirect(url_for('dashboard'))
+        if u and verificar_password(u.password_hash, request.form['password']): login_user(u); return redirect(url_for('dashboard'))
         flash("Acceso denegado.")
     return render_template('login.html')
 
@@ -306,32 +1196,141 @@ def login():
 def logout(): logout_user(); return redirect(url_for('index'))
 
 @app.route('/buscar')
-def buscar(): return render_template('search.html', resultados=Publicacion.query.all())
+def buscar():
+    # Mientras el catálogo no cambie (ni el usuario ni las plantillas) el navegador revalida con 304
+    version = version_catalogo()
+    usuario = '%s:%s' % (current_user.id, current_user.nombre) if current_user.is_authenticated else ''
+    etag = 'b%d-%s' % (version, hashlib.sha1((usuario + HUELLA_PLANTILLAS).encode('utf-8')).hexdigest()[:16])
+    def generar():
+        resultados, siguiente = pagina_catalogo(filtrar_catalogo(Publicacion.query, request.args), request.args)
+        filtros = {k: request.args.get(k, '') for k in ('q', 'cat', 'tp', 'pmin', 'pmax')}
+        return render_template('search.html', resultados=resultados, siguiente=siguiente, filtros=filtros, version=version)
+    return respuesta_condicional(etag, generar)
+
+@app.route('/api/catalogo')
+def api_catalogo():
+    # Misma consulta que /buscar en JSON; ETag = versión del catálogo
+    version = version_catalogo()
+    def generar():
+        filas, siguiente = pagina_catalogo(filtrar_catalogo(Publicacion.query, request.args), request.args)
+        return jsonify(version=version, resultados=[publicacion_dict(p) for p in filas], siguiente=siguiente)
+    return respuesta_condicional('c%d' % version, generar)
+
+@app.route('/api/catalogo/cambios')
+def api_catalogo_cambios():
+    # ?desde=N[&cat=][&lat=&lng=&radio_km=]: cambios posteriores a la versión N; con mas=true, repetir con la versión devuelta
+    desde = request.args.get('desde', type=int)
+    if desde is None: return jsonify(error='Parámetro desde (versión) obligatorio.'), 400
+    try: cat, caja = alcance(request.args.get('cat'), request.args.get('lat'), request.args.get('lng'), request.args.get('radio_km'))
+    except ValueError as e: return jsonify(error=str(e)), 400
+    def generar():
+        cambios, version, mas = cambios_desde(desde, cat, caja)
+        return jsonify(version=version, cambios=cambios, mas=mas)
+    return respuesta_condicional('d%d' % version_catalogo(), generar)
+
+@app.route('/api/publicaciones/importar', methods=['POST'])
+@login_required
+def api_importar_publicaciones():
+    # Cuerpo CSV (text/csv) o NDJSON; se lee en streaming y las publicaciones quedan a nombre del usuario
+    return jsonify(importar_publicaciones(request.stream, formato_solicitado(), current_user.id))
+
+@app.route('/api/publicaciones/exportar')
+@login_required
+def api_exportar_publicaciones(): return respuesta_exportacion(consulta_publicaciones(), COLUMNAS_PUBLICACION, 'publicaciones')
+
+@app.route('/api/solicitudes/exportar')
+@login_required
+def api_exportar_solicitudes():
+    # El administrador exporta todo; cada proveedor, las solicitudes recibidas en sus publicaciones
+    proveedor = None if current_user.email == 'admin@lifelink.com' else current_user.id
+    return respuesta_exportacion(consulta_solicitudes(proveedor), COLUMNAS_SOLICITUD, 'solicitudes')
+
+@app.route('/api/cercanos')
+def api_cercanos():
+    lat, lng = request.args.get('lat', type=float), request.args.get('lng', type=float)
+    if lat is None or lng is None: return jsonify(error='Parámetros lat y lng obligatorios.'), 400
+    # float() acepta nan/inf/1e308: las comparaciones de rango los descartan (NaN nunca cumple un rango)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180): return jsonify(error='lat debe estar en [-90, 90] y lng en [-180, 180].'), 400
+    n = min(max(request.args.get('n', POR_PAGINA, type=int), 1), MAX_POR_PAGINA)
+    radio = request.args.get('radio_km', type=float)
+    if radio is not None and not (0 < radio < math.inf): return jsonify(error='radio_km debe ser un número positivo finito.'), 400
+    consulta = filtrar_catalogo(Publicacion.query, request.args)
+    res = mas_cercanos(consulta, lat, lng, n, min(radio, RADIO_MAX_KM) if radio else RADIO_MAX_KM)
+    return jsonify(resultados=[dict(publicacion_dict(p), distancia_km=round(d, 3)) for d, p in res])
+
+@app.route('/api/donantes')
+@login_required
+def api_donantes():
+    # Nombres y teléfonos de donantes: sólo para la coordinación (cuenta administradora)
+    if current_user.email != 'admin@lifelink.com': abort(403)
+    receptor, ciudad = request.args.get('receptor', '').strip().upper(), request.args.get('ciudad', '')
+    if receptor not in COMPATIBLES or not normalizar_ubicacion(ciudad): return jsonify(error='Parámetros receptor (tipo ABO/Rh) y ciudad obligatorios.'), 400
+    n = min(max(request.args.get('n', POR_PAGINA, type=int), 1), MAX_POR_PAGINA)
+    filas, siguiente = donantes_compatibles(receptor, ciudad, request.args.get('cursor', type=int), n)
+    return jsonify(donantes=[{'id': u.id, 'nombre': u.nombre, 'telefono': u.telefono, 'tipo_sangre': u.tipo_sangre, 'ubicacion': u.ubicacion} for u in filas], siguiente=siguiente)
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    # Número fijo de consultas: las relaciones que recorre dashboard.html se cargan con JOIN
     pubs = Publicacion.query.filter_by(id_proveedor=current_user.id).all()
-    p_ids = [x.id_oferta_insumo for x in pubs]
-    s_recibidas = Solicitud.query.filter(Solicitud.id_publicacion.in_(p_ids)).all() if p_ids else []
-    s_enviadas = Solicitud.query.filter_by(id_solicitante=current_user.id).all()
+    s_recibidas = Solicitud.query.join(Solicitud.publicacion).filter(Publicacion.id_proveedor == current_user.id).options(joinedload(Solicitud.publicacion), joinedload(Solicitud.solicitante)).all()
+    s_enviadas = Solicitud.query.filter_by(id_solicitante=current_user.id).options(joinedload(Solicitud.publicacion).joinedload(Publicacion.proveedor)).all()
     stats, tickets = None, None
     if current_user.email == 'admin@lifelink.com':
-        stats = {'total_usuarios': User.query.count(), 'total_publicaciones': Publicacion.query.count(), 'total_tickets': Ticket.query.count()}
-        tickets = Ticket.query.order_by(Ticket.fecha.desc()).limit(5).all()
+        stats = estadisticas_globales()
+        tickets = Ticket.query.options(joinedload(Ticket.usuario)).order_by(Ticket.fecha.desc()).limit(5).all()
     return render_template('dashboard.html', publicaciones=pubs, solicitudes_recibidas=s_recibidas, solicitudes_enviadas=s_enviadas, stats=stats, tickets=tickets)
 
 @app.route('/publicar', methods=['GET', 'POST'])
 @login_required
 def publicar():
     if request.method == 'POST':
+        # La imagen se procesa y sube en segundo plano (cola_media); la publicación nace con marcador
         img = request.files.get('imagen')
-        img_url = "https://via.placeholder.com/400"
-        if img: img_url = cloudinary.uploader.upload(img)['secure_url']
-        p = Publicacion(id_proveedor=current_user.id, nombre=request.form['nombre'], categoria=request.form['cat'], tipo_publicacion=request.form['tp'], precio=float(request.form.get('precio', 0) or 0), imagen_url=img_url, latitud=float(request.form.get('lat', 19.43)), longitud=float(request.form.get('lng', -99.13)), direccion_text=request.form.get('dir', ''))
-        db.session.add(p); db.session.commit(); flash("Recurso Certificado."); return redirect(url_for('dashboard'))
+        p = Publicacion(id_proveedor=current_user.id, nombre=request.form['nombre'], categoria=request.form['cat'], tipo_publicacion=request.form['tp'], precio=float(request.form.get('precio', 0) or 0), imagen_url=IMAGEN_PENDIENTE, latitud=float(request.form.get('lat', 19.43)), longitud=float(request.form.get('lng', -99.13)), direccion_text=request.form.get('dir', ''))
+        db.session.add(p); db.session.flush()
+        cambios = registrar_cambios([fila_cambio('alta', p.id_oferta_insumo, p.categoria, p.celda_lat, p.celda_lng)]); db.session.commit()
+        difundir_cambios(cambios)
+        if img and img.filename: cola_media.encolar(p.id_oferta_insumo, guardar_pendiente(img, p.id_oferta_insumo))
+        flash("Recurso Certificado."); return redirect(url_for('dashboard'))
     return render_template('publish.html')
 
+@app.route('/media/<path:nombre>')
+def media(nombre): return send_from_directory(os.path.join(MEDIA_DIR, 'publicas'), nombre, max_age=31536000)
+
+@app.route('/api/media/metricas')
+@login_required
+def api_media_metricas():
+    if current_user.email != 'admin@lifelink.com': abort(403)
+    return jsonify(cola_media.estado())
+
+@app.route('/metrics')
+def metrics():
+    # Protegido sólo si se define METRICS_TOKEN (Authorization: Bearer <token>)
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != 'Bearer ' + token: abort(401)
+    lineas = metricas.exportar()
+    def gauge(nombre, ayuda, valor, tipo='gauge'): lineas.extend(['# HELP %s %s' % (nombre, ayuda), '# TYPE %s %s' % (nombre, tipo), '%s %s' % (nombre, valor)])
+    media, ident = cola_media.estado(), cache_identidades.estado()
+    gauge('lifelink_media_cola_profundidad', 'Trabajos de imagen en cola', media['profundidad'])
+    gauge('lifelink_media_en_espera', 'Trabajos de imagen esperando reintento', media['en_espera'])
+    gauge('lifelink_media_procesados_total', 'Imágenes procesadas', media['procesados'], 'counter')
+    gauge('lifelink_media_fallidos_total', 'Imágenes con subida fallida definitiva', media['fallidos'], 'counter')
+    gauge('lifelink_media_segundos_total', 'Tiempo acumulado procesando imágenes', '%.6f' % media['segundos_total'], 'counter')
+    gauge('lifelink_identidades_aciertos_total', 'Aciertos de la caché de identidades', ident['aciertos'], 'counter')
+    gauge('lifelink_identidades_fallos_total', 'Fallos de la caché de identidades', ident['fallos'], 'counter')
+    gauge('lifelink_identidades_entradas', 'Entradas en la caché de identidades', ident['entradas'])
+    gauge('lifelink_chat_pendientes', 'Mensajes de chat pendientes de volcar', len(buffer_chat.pendientes))
+    gauge('lifelink_chat_descartados_total', 'Mensajes de chat descartados por buffer lleno', buffer_chat.descartados, 'counter')
+    return Response('\n'.join(lineas) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/identidades')
+@login_required
+def api_cache_identidades():
+    if current_user.email != 'admin@lifelink.com': abort(403)
+    return jsonify(cache_identidades.estado())
+
 @app.route('/confirmar_compra/<int:id>')
 @login_required
 def confirmar_compra(id): return render_template('checkout.html', pub=Publicacion.query.get_or_404(id))
@@ -349,7 +1348,9 @@ def chat(id_solicitud): return render_template('chat.html', solicitud=Solicitud.
 @login_required
 def borrar_publicacion(id):
     p = Publicacion.query.get_or_404(id)
-    if p.id_proveedor == current_user.id: db.session.delete(p); db.session.commit()
+    if p.id_proveedor == current_user.id:
+        cambios = registrar_cambios([fila_cambio('baja', p.id_oferta_insumo, p.categoria, p.celda_lat, p.celda_lng)])
+        db.session.delete(p); db.session.commit(); difundir_cambios(cambios)
     return redirect(url_for('dashboard'))
 
 @app.route('/perfil')
@@ -360,10 +1361,12 @@ def perfil(): return render_template('perfil.html')
 @login_required
 def editar_perfil():
     if request.method == 'POST':
-        current_user.nombre = request.form['n']
-        current_user.telefono = request.form['t']
-        current_user.ubicacion = request.form['u']
-        db.session.commit(); flash("Perfil actualizado."); return redirect(url_for('perfil'))
+        # current_user es una instantánea de caché: se actualiza la fila y se invalida la entrada
+        u = db.session.get(User, current_user.id)
+        u.nombre = request.form['n']
+        u.telefono = request.form['t']
+        u.ubicacion = request.form['u']
+        db.session.commit(); cache_identidades.invalidar(u.id); flash("Perfil actualizado."); return redirect(url_for('perfil'))
     return render_template('editar_perfil.html')
 
 @app.route('/soporte', methods=['GET', 'POST'])
@@ -374,16 +1377,155 @@ def soporte():
     return render_template('soporte.html')
 
 @app.route('/politicas')
+@pagina_estatica
 def politicas(): return render_template('politicas.html')
 
 @app.route('/reglas')
+@pagina_estatica
 def reglas(): return render_template('reglas.html')
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# --- CHAT: HISTORIAL CON ESCRITURA DIFERIDA (write-behind) ---
+TAM_LOTE_CHAT = 200       # mensajes por INSERT en lote
+INTERVALO_CHAT = 0.5      # segundos máximos que un mensaje espera en memoria
+HISTORIAL_CHAT = 50       # mensajes por página de historial
+MAX_PENDIENTES_CHAT = int(os.environ.get('MAX_PENDIENTES_CHAT', 50000))  # tope en memoria si la base no responde
+
+class BufferMensajes:
+    # Acumula mensajes en memoria y los vuelca con un solo executemany por lote (tamaño o intervalo).
+    # Con la base caída el buffer no crece sin límite: pasado 'maximo' se descartan los más antiguos.
+    def __init__(self, tam_lote=TAM_LOTE_CHAT, intervalo=INTERVALO_CHAT, maximo=MAX_PENDIENTES_CHAT):
+        self.tam_lote, self.intervalo, self.maximo = tam_lote, intervalo, maximo
+        self.pendientes, self.lock, self.tarea, self.descartados = [], threading.Lock(), None, 0
+
+    def _recortar(self):
+        # Llamar con self.lock tomado
+        sobra = len(self.pendientes) - self.maximo
+        if sobra > 0:
+            del self.pendientes[:sobra]; self.descartados += sobra
+            app.logger.warning("Buffer de chat lleno: %d mensajes antiguos descartados", sobra)
+
+    def agregar(self, fila):
+        with self.lock:
+            self.pendientes.append(fila); self._recortar()
+            lleno = len(self.pendientes) >= self.tam_lote
+        if self.tarea is None: self.tarea = socketio.start_background_task(self._ciclo)
+        if lleno: socketio.start_background_task(self.volcar)
+
+    def volcar(self):
+        with self.lock: lote, self.pendientes = self.pendientes, []
+        if not lote: return 0
+        with app.app_context():
+            try:
+                db.session.execute(Mensaje.__table__.insert(), lote); db.session.commit()
+                return len(lote)
+            except Exception:
+                db.session.rollback()
+            # El lote falló: fila por fila, descartando sólo las que la base rechaza por sí mismas
+            guardados = 0
+            for i, fila in enumerate(lote):
+                try:
+                    db.session.execute(Mensaje.__table__.insert(), fila); db.session.commit(); guardados += 1
+                except (IntegrityError, DataError):
+                    db.session.rollback(); app.logger.exception("Mensaje de chat descartado: %r", fila)
+                except Exception:
+                    # Base no disponible: lo que queda vuelve al buffer para el siguiente ciclo
+                    db.session.rollback()
+                    with self.lock: self.pendientes[:0] = lote[i:]; self._recortar()
+                    raise
+            return guardados
+
+    def _ciclo(self):
+        while True:
+            socketio.sleep(self.intervalo)
+            try: self.volcar()
+            except Exception: app.logger.exception("Error volcando mensajes de chat")
+
+buffer_chat = BufferMensajes()
+atexit.register(buffer_chat.volcar)
+
+def es_participante(sol, u_id):
+    return sol is not None and u_id in (sol.id_solicitante, sol.publicacion.id_proveedor if sol.publicacion else None)
+
+def historial_chat(id_solicitud, cursor=None, limite=HISTORIAL_CHAT):
+    # Últimos mensajes (más recientes primero) con cursor hacia atrás sobre el id
+    buffer_chat.volcar()
+    consulta = Mensaje.query.filter_by(id_solicitud=id_solicitud)
+    if cursor: consulta = consulta.filter(Mensaje.id < cursor)
+    filas = consulta.order_by(Mensaje.id.desc()).limit(limite + 1).all()
+    siguiente = filas[limite - 1].id if len(filas) > limite else None
+    return [{'id': m.id, 'user': m.autor, 'msg': m.texto, 'fecha': m.fecha.isoformat()} for m in filas[:limite]], siguiente
+
+def solicitud_de_sala(d):
+    # Solicitud de la sala si el usuario autenticado participa en ella; None en cualquier otro caso
+    if not current_user.is_authenticated or not isinstance(d, dict): return None
+    try: id_sol = int(d.get('room'))
+    except (TypeError, ValueError): return None
+    sol = db.session.get(Solicitud, id_sol)
+    return sol if es_participante(sol, current_user.id) else None
+
+def emitir_historial(d):
+    sol = solicitud_de_sala(d)
+    if sol is None: return
+    cursor = d.get('cursor') if isinstance(d.get('cursor'), int) else None
+    mensajes, siguiente = historial_chat(sol.id_solicitud, cursor)
+    emit('historial', {'mensajes': mensajes, 'siguiente': siguiente})
+
+# --- ESCALADO HORIZONTAL: cola de mensajes entre workers ---
+# SOCKETIO_MESSAGE_QUEUE vacío: un solo proceso. 'local' o 'local://ruta|host:puerto': broker de
+# lifelink_broker.py en la misma máquina. Cualquier otra URL (redis://, amqp://, zmq+...) la
+# resuelve Flask-SocketIO directamente.
+def opciones_cola_mensajes(url):
+    if not url: return {}
+    if url == 'local' or url.startswith('local://'):
+        from lifelink_broker import GestorLocal
+        return {'client_manager': GestorLocal(url)}
+    return {'message_queue': url}
+
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', **opciones_cola_mensajes(os.environ.get('SOCKETIO_MESSAGE_QUEUE')))
+cola_media.recuperar_pendientes()
 @socketio.on('join')
-def on_join(d): join_room(d['room'])
+@medido('join')
+def on_join(d):
+    # Sólo los participantes entran a la sala; la sesión del socket recuerda las salas autorizadas
+    sol = solicitud_de_sala(d)
+    if sol is None: return
+    join_room(str(sol.id_solicitud))
+    session['salas_chat'] = list(set(session.get('salas_chat', [])) | {sol.id_solicitud})
+    emitir_historial(d)
+@socketio.on('historial')
+@medido('historial')
+def on_historial(d): emitir_historial(d)
 @socketio.on('enviar_mensaje')
-def handle_m(d): emit('nuevo_mensaje', {'msg': d['msg'], 'user': current_user.nombre}, room=d['room'])
+@medido('enviar_mensaje')
+def handle_m(d):
+    # Se valida antes de difundir o guardar: usuario autenticado, sala autorizada en 'join' y texto no vacío.
+    # current_user proviene de cache_identidades y las salas de la sesión del socket: ninguna consulta por mensaje.
+    if not current_user.is_authenticated or not isinstance(d, dict): return
+    msg, sala = d.get('msg'), d.get('room')
+    try: sala = int(sala)
+    except (TypeError, ValueError): return
+    if not isinstance(msg, str) or not msg.strip() or sala not in session.get('salas_chat', ()): return
+    emit('nuevo_mensaje', {'msg': msg, 'user': current_user.nombre}, room=str(sala))
+    buffer_chat.agregar({'id_solicitud': sala, 'id_usuario': current_user.id, 'autor': current_user.nombre, 'texto': msg, 'fecha': datetime.utcnow()})
+
+@socketio.on('suscribir_catalogo')
+@medido('suscribir_catalogo')
+def on_suscribir_catalogo(d):
+    # {cat?, lat?, lng?, radio_km?, version?}: reemplaza la suscripción anterior y, con version, pone al día
+    d = d or {}
+    try: cat, caja = alcance(d.get('cat'), d.get('lat'), d.get('lng'), d.get('radio_km'))
+    except ValueError as e: emit('catalogo_error', {'error': str(e)}); return
+    for sala in rooms():
+        if sala.startswith('catalogo:'): leave_room(sala)
+    for sala in salas_suscripcion(cat, caja): join_room(sala)
+    if isinstance(d.get('version'), int):
+        cambios, version, mas = cambios_desde(d['version'], cat, caja)
+        emit('catalogo_delta', {'version': version, 'cambios': cambios, 'mas': mas})
+@socketio.on('desuscribir_catalogo')
+@medido('desuscribir_catalogo')
+def on_desuscribir_catalogo(d=None):
+    for sala in rooms():
+        if sala.startswith('catalogo:'): leave_room(sala)
 
 if __name__ == '__main__':
-    socketio.run(app, debug=False)
+    socketio.run(app, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 5000)), debug=False)
@@ -0,0 +1,136 @@
+"""Broker local de mensajes para repartir eventos Socket.IO entre varios workers.
+
+Sustituto ligero de Redis para correr varios procesos de LifeLink en la misma máquina:
+un servidor de difusión (fan-out) sobre socket Unix o TCP, sólo con la biblioteca estándar,
+y un client manager de python-socketio que publica/escucha en él.
+
+Uso:
+    python lifelink_broker.py                      # socket Unix por defecto
+    python lifelink_broker.py 127.0.0.1:6100       # TCP
+    SOCKETIO_MESSAGE_QUEUE=local:///tmp/lifelink-socketio.sock gunicorn ...
+"""
+import os
+import sys
+import json
+import queue
+import socket
+import threading
+import socketserver
+from socketio import PubSubManager
+
+DIRECCION_POR_DEFECTO = '/tmp/lifelink-socketio.sock'
+MAX_PENDIENTES_SUSCRIPTOR = int(os.environ.get('BROKER_MAX_PENDIENTES', 10000))  # líneas en cola antes de soltar al suscriptor
+
+def parsear_direccion(url):
+    # 'local:///ruta.sock' | 'local://host:puerto' | 'local' -> (familia, dirección)
+    destino = url.split('://', 1)[1] if '://' in url else (url if url != 'local' else '')
+    destino = destino or DIRECCION_POR_DEFECTO
+    if destino.startswith('/'): return socket.AF_UNIX, destino
+    host, puerto = destino.rsplit(':', 1)
+    return socket.AF_INET, (host, int(puerto))
+
+def conectar(url, modo):
+    familia, direccion = parsear_direccion(url)
+    s = socket.socket(familia, socket.SOCK_STREAM)
+    s.connect(direccion)
+    s.sendall(modo + b'\n')
+    return s
+
+# --- SERVIDOR DE DIFUSIÓN ---
+class _Suscriptor:
+    # Cola acotada + hilo escritor propios: un suscriptor lento no frena a los publicadores ni a los demás.
+    # Si su cola se llena se le desconecta (el GestorLocal del worker reconecta solo).
+    def __init__(self, conexion, salida):
+        self.conexion, self.salida = conexion, salida
+        self.cola, self.activo = queue.Queue(MAX_PENDIENTES_SUSCRIPTOR), True
+        threading.Thread(target=self._escribir, daemon=True).start()
+
+    def encolar(self, linea):
+        try: self.cola.put_nowait(linea); return True
+        except queue.Full:
+            sys.stderr.write('Suscriptor descartado: %d líneas sin leer\n' % self.cola.qsize())
+            self.cerrar(); return False
+
+    def cerrar(self):
+        if not self.activo: return
+        self.activo = False
+        try: self.conexion.shutdown(socket.SHUT_RDWR)  # desbloquea al escritor y al handler
+        except OSError: pass
+        try: self.cola.put_nowait(None)
+        except queue.Full: pass
+
+    def _escribir(self):
+        while self.activo:
+            linea = self.cola.get()
+            if linea is None: return
+            try: self.salida.write(linea)
+            except OSError: self.cerrar(); return
+
+class _Difusion(socketserver.StreamRequestHandler):
+    # Primera línea: SUB (recibe la difusión) o PUB (envía). Cada línea publicada (un mensaje JSON)
+    # se reenvía a todos los suscriptores, incluidos los del mismo worker emisor.
+    def handle(self):
+        if self.rfile.readline().strip() == b'SUB':
+            sus = _Suscriptor(self.connection, self.wfile)
+            with self.server.lock: self.server.clientes.add(sus)
+            try: self.rfile.read()  # bloquea hasta que el suscriptor se desconecte o se le suelte
+            except OSError: pass
+            finally:
+                with self.server.lock: self.server.clientes.discard(sus)
+                sus.cerrar()
+            return
+        for linea in self.rfile:
+            # Bajo el lock sólo se encola (sin bloquear): todos los suscriptores ven el mismo orden de líneas
+            with self.server.lock:
+                for sus in list(self.server.clientes):
+                    if not sus.encolar(linea): self.server.clientes.discard(sus)
+
+def crear_broker(url=DIRECCION_POR_DEFECTO):
+    familia, direccion = parsear_direccion(url)
+    if familia == socket.AF_UNIX:
+        if os.path.exists(direccion): os.unlink(direccion)
+        srv = socketserver.ThreadingUnixStreamServer(direccion, _Difusion)
+    else:
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        srv = socketserver.ThreadingTCPServer(direccion, _Difusion)
+    srv.daemon_threads = True
+    srv.clientes, srv.lock = set(), threading.Lock()
+    return srv
+
+# --- CLIENT MANAGER PARA PYTHON-SOCKETIO ---
+class GestorLocal(PubSubManager):
+    # Publica por una conexión y escucha por otra; bajo eventlet los sockets son verdes
+    name = 'lifelink-local'
+
+    def __init__(self, url='local', channel='flask-socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.url, self.pub, self.lock = url, None, threading.Lock()
+
+    def _publish(self, data):
+        linea = (json.dumps(dict(data, canal=self.channel)) + '\n').encode()
+        with self.lock:
+            for intento in (0, 1):
+                try:
+                    if self.pub is None: self.pub = conectar(self.url, b'PUB')
+                    self.pub.sendall(linea)
+                    return
+                except OSError:
+                    self.pub = None
+                    if intento: raise
+
+    def _listen(self):
+        # Reconecta indefinidamente: si el generador termina, python-socketio detiene la escucha
+        while True:
+            try:
+                with conectar(self.url, b'SUB').makefile('rb') as entrada:
+                    for linea in entrada:
+                        msg = json.loads(linea)
+                        if msg.pop('canal', None) == self.channel: yield msg
+            except OSError as e:
+                self._get_logger().warning('Broker local no disponible (%s); reintentando', e)
+            self.server.sleep(1)
+
+if __name__ == '__main__':
+    broker = crear_broker(sys.argv[1] if len(sys.argv) > 1 else DIRECCION_POR_DEFECTO)
+    print('Broker LifeLink escuchando en %s' % (broker.server_address,))
+    broker.serve_forever()
@@ -0,0 +1,8 @@
+"""Entorno común de las pruebas: una base SQLite y un MEDIA_DIR temporales, fijados antes de importar lifelink_app."""
+import os
+import sys
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'pruebas.db')
+os.environ['MEDIA_DIR'] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,89 @@
+"""Integración: un 'nuevo_mensaje' emitido en el worker A llega al cliente conectado al worker B.
+
+Levanta lifelink_broker.py y dos procesos de lifelink_app.py en puertos libres. La latencia del
+fan-out con más workers se mide en benchmarks/bench_socketio_fanout.py.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+
+import pytest
+
+requests = pytest.importorskip('requests')
+pytest.importorskip('websocket')
+socketio = pytest.importorskip('socketio')
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ADMIN = {'email': 'admin@lifelink.com', 'password': 'admin123'}
+
+def puerto_libre():
+    s = socket.socket(); s.bind(('127.0.0.1', 0))
+    puerto = s.getsockname()[1]; s.close()
+    return puerto
+
+def esperar(condicion, limite=30):
+    fin = time.time() + limite
+    while time.time() < fin:
+        if condicion(): return True
+        time.sleep(0.1)
+    return False
+
+def escuchando(puerto):
+    try: socket.create_connection(('127.0.0.1', puerto), 0.5).close(); return True
+    except OSError: return False
+
+def sesion(url):
+    http = requests.Session()
+    http.post(url + '/login', data=ADMIN, allow_redirects=False)
+    return http
+
+def preparar_sala(url):
+    # El chat exige participar en la solicitud: el admin publica un recurso y se lo solicita a sí mismo
+    http = sesion(url)
+    http.post(url + '/publicar', data={'nombre': 'Prueba broker', 'cat': 'Sangre', 'tp': 'Donacion', 'lat': '19.43', 'lng': '-99.13', 'dir': 'Prueba'}, allow_redirects=False)
+    id_pub = http.get(url + '/api/catalogo', params={'n': 1}).json()['resultados'][0]['id']
+    http.post(url + '/procesar_transaccion/%d' % id_pub, data={'mp': 'Efectivo'}, allow_redirects=False)
+    ultima = http.get(url + '/api/solicitudes/exportar', params={'formato': 'ndjson'}).text.strip().splitlines()[-1]
+    return str(json.loads(ultima)['id_solicitud'])
+
+def cliente(url, recibidos, sala):
+    http = sesion(url)
+    c = socketio.Client(reconnection=False)
+    c.on('historial', lambda d: recibidos.append('historial'))
+    c.on('nuevo_mensaje', lambda d: recibidos.append(d['msg']))
+    c.connect(url, headers={'Cookie': '; '.join('%s=%s' % kv for kv in http.cookies.items())}, transports=['websocket'])
+    c.emit('join', {'room': sala})
+    assert esperar(lambda: 'historial' in recibidos, 10), 'join sin historial en %s' % url
+    return c
+
+@pytest.fixture
+def workers(tmp_path):
+    cola = 'local://' + str(tmp_path / 'broker.sock')
+    env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=cola, DATABASE_URL='sqlite:///' + str(tmp_path / 'broker.db'), MEDIA_DIR=str(tmp_path / 'media'))
+    procesos = [subprocess.Popen([sys.executable, os.path.join(RAIZ, 'lifelink_broker.py'), cola], stdout=subprocess.DEVNULL)]
+    try:
+        assert esperar(lambda: (tmp_path / 'broker.sock').exists(), 10), 'el broker no arrancó'
+        urls = []
+        for _ in range(2):
+            puerto = puerto_libre()
+            procesos.append(subprocess.Popen([sys.executable, os.path.join(RAIZ, 'lifelink_app.py')], env=dict(env, PORT=str(puerto)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            assert esperar(lambda: escuchando(puerto)), 'worker en puerto %d no respondió' % puerto
+            urls.append('http://127.0.0.1:%d' % puerto)
+        yield urls
+    finally:
+        for p in procesos: p.terminate()
+        for p in procesos: p.wait(10)
+
+def test_mensaje_del_worker_a_llega_al_worker_b(workers):
+    url_a, url_b = workers
+    sala = preparar_sala(url_a)
+    buzon_a, buzon_b = [], []
+    # Sin disconnect(): con eventlet parcheado (lifelink_app importado por otros tests) el cierre del
+    # websocket se bloquea; los clientes terminan solos cuando el fixture detiene los workers.
+    a = cliente(url_a, buzon_a, sala); cliente(url_b, buzon_b, sala)
+    a.emit('enviar_mensaje', {'msg': 'integracion', 'room': sala})
+    assert esperar(lambda: 'integracion' in buzon_b, 10), 'worker B no recibió el mensaje del worker A'
+    assert 'integracion' in buzon_a
@@ -0,0 +1,13 @@
+"""Validación de parámetros de /api/cercanos."""
+import pytest
+
+import lifelink_app as L
+
+@pytest.mark.parametrize('consulta', ['lat=nan&lng=0', 'lat=0&lng=nan', 'lat=1e308&lng=0', 'lat=0&lng=inf', 'lat=-inf&lng=0', 'lat=91&lng=0', 'lat=0&lng=-181',
+                                      'lat=19.4&lng=-99.1&radio_km=nan', 'lat=19.4&lng=-99.1&radio_km=inf', 'lat=19.4&lng=-99.1&radio_km=0', 'lat=19.4&lng=-99.1&radio_km=-5', 'lat=x&lng=1'])
+def test_parametros_invalidos_dan_400(consulta):
+    assert L.app.test_client().get('/api/cercanos?' + consulta).status_code == 400
+
+def test_consulta_valida():
+    r = L.app.test_client().get('/api/cercanos?lat=19.43&lng=-99.13&radio_km=1e6&n=5')
+    assert r.status_code == 200 and 'resultados' in r.json
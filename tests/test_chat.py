@@ -0,0 +1,78 @@
+"""Chat: autorización de salas, validación de mensajes y buffer de escritura diferida."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import lifelink_app as L
+from test_dashboard import crear_usuario, cliente
+
+@pytest.fixture(scope='module')
+def sala():
+    proveedor, solicitante = crear_usuario('chat_prov@test.com'), crear_usuario('chat_sol@test.com')
+    crear_usuario('chat_ajeno@test.com')
+    with L.app.app_context():
+        p = L.Publicacion(id_proveedor=proveedor, nombre='Plasma', categoria='Sangre', tipo_publicacion='Donacion', latitud=19.43, longitud=-99.13)
+        L.db.session.add(p); L.db.session.flush()
+        s = L.Solicitud(id_solicitante=solicitante, id_publicacion=p.id_oferta_insumo, metodo_pago='Efectivo')
+        L.db.session.add(s); L.db.session.commit()
+        return s.id_solicitud, solicitante
+
+def socket_de(email=None):
+    return L.socketio.test_client(L.app, flask_test_client=cliente(email) if email else L.app.test_client())
+
+def eventos(sc, nombre): return [r['args'][0] for r in sc.get_received() if r['name'] == nombre]
+
+def fila(id_sol, id_usuario, texto):
+    return {'id_solicitud': id_sol, 'id_usuario': id_usuario, 'autor': 'X', 'texto': texto, 'fecha': datetime.utcnow()}
+
+def test_join_solo_participantes(sala):
+    id_sol, _ = sala
+    ajeno = socket_de('chat_ajeno@test.com'); ajeno.emit('join', {'room': id_sol})
+    assert eventos(ajeno, 'historial') == []
+    anonimo = socket_de(); anonimo.emit('join', {'room': id_sol})
+    assert eventos(anonimo, 'historial') == []
+    participante = socket_de('chat_sol@test.com'); participante.emit('join', {'room': id_sol})
+    assert eventos(participante, 'historial') == [{'mensajes': [], 'siguiente': None}]
+
+def test_mensajes_invalidos_o_de_salas_no_autorizadas(sala):
+    id_sol, _ = sala
+    participante = socket_de('chat_sol@test.com'); participante.emit('join', {'room': id_sol}); participante.get_received()
+    ajeno, anonimo = socket_de('chat_ajeno@test.com'), socket_de()
+    antes = len(L.buffer_chat.pendientes)
+    ajeno.emit('enviar_mensaje', {'msg': 'hola', 'room': id_sol})
+    anonimo.emit('enviar_mensaje', {'msg': 'hola', 'room': id_sol})
+    for invalido in ({'msg': '   ', 'room': id_sol}, {'msg': 5, 'room': id_sol}, {'msg': 'hola', 'room': 'x'}, {'msg': 'hola', 'room': id_sol + 999}, 'texto'):
+        participante.emit('enviar_mensaje', invalido)
+    assert eventos(participante, 'nuevo_mensaje') == [] and len(L.buffer_chat.pendientes) == antes
+    participante.emit('enviar_mensaje', {'msg': 'hola', 'room': id_sol})
+    assert eventos(participante, 'nuevo_mensaje') == [{'msg': 'hola', 'user': 'CHAT_SOL'}]
+    L.buffer_chat.volcar()
+    with L.app.app_context():
+        assert [m.texto for m in L.Mensaje.query.filter_by(id_solicitud=id_sol)] == ['hola']
+
+def test_volcado_descarta_solo_la_fila_rechazada(sala):
+    id_sol, usuario = sala
+    buf = L.BufferMensajes()
+    for texto in ('uno', None, 'tres'): buf.pendientes.append(fila(id_sol, usuario, texto))  # texto NOT NULL
+    assert buf.volcar() == 2
+    with L.app.app_context():
+        assert {'uno', 'tres'} <= {m.texto for m in L.Mensaje.query.filter_by(id_solicitud=id_sol)}
+    assert buf.pendientes == []
+
+def test_base_caida_reencola_con_tope(sala, monkeypatch):
+    id_sol, usuario = sala
+    buf = L.BufferMensajes(maximo=5)
+    def caida(*a, **k): raise OperationalError('INSERT', {}, Exception('base no disponible'))
+    monkeypatch.setattr(L.db.session, 'execute', caida)
+    for i in range(4): buf.agregar(fila(id_sol, usuario, 'm%d' % i))
+    with pytest.raises(OperationalError): buf.volcar()
+    assert [f['texto'] for f in buf.pendientes] == ['m0', 'm1', 'm2', 'm3'] and buf.descartados == 0
+    for i in range(4, 7): buf.agregar(fila(id_sol, usuario, 'm%d' % i))
+    assert [f['texto'] for f in buf.pendientes] == ['m2', 'm3', 'm4', 'm5', 'm6'] and buf.descartados == 2
+    monkeypatch.undo()
+    assert buf.volcar() == 5 and buf.pendientes == []
+
+def test_metrics_expone_descartados():
+    cuerpo = L.app.test_client().get('/metrics').get_data(as_text=True)
+    assert '# TYPE lifelink_chat_descartados_total counter' in cuerpo
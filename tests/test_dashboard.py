@@ -0,0 +1,62 @@
+"""Número de consultas SQL por petición de /dashboard (eager loading + estadísticas con TTL)."""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import lifelink_app as L
+
+@pytest.fixture
+def sentencias():
+    registradas = []
+    def registrar(conn, cursor, statement, params, context, executemany): registradas.append(statement)
+    event.listen(Engine, 'before_cursor_execute', registrar)
+    yield registradas
+    event.remove(Engine, 'before_cursor_execute', registrar)
+
+def crear_usuario(email):
+    with L.app.app_context():
+        u = L.User(nombre=email.split('@')[0].upper(), email=email, telefono='5500000000', tipo_sangre='O+', ubicacion='CDMX', password_hash=L.hash_password('clave'))
+        L.db.session.add(u); L.db.session.commit()
+        return u.id
+
+def crear_solicitudes(id_proveedor, id_solicitante, n):
+    # n publicaciones del proveedor, cada una con una solicitud del solicitante
+    with L.app.app_context():
+        for i in range(n):
+            p = L.Publicacion(id_proveedor=id_proveedor, nombre='Recurso %d' % i, categoria='Sangre', tipo_publicacion='Donacion', latitud=19.43, longitud=-99.13)
+            L.db.session.add(p); L.db.session.flush()
+            L.db.session.add(L.Solicitud(id_solicitante=id_solicitante, id_publicacion=p.id_oferta_insumo, metodo_pago='Efectivo'))
+        L.db.session.commit()
+
+def cliente(email, password='clave'):
+    c = L.app.test_client()
+    assert c.post('/login', data={'email': email, 'password': password}).status_code == 302
+    return c
+
+def consultas_dashboard(c, sentencias):
+    c.get('/dashboard')  # calienta la caché de identidades: sólo se cuenta el camino de datos del dashboard
+    sentencias.clear()
+    assert c.get('/dashboard').status_code == 200
+    return list(sentencias)
+
+def test_consultas_constantes_con_1_y_n_solicitudes(sentencias):
+    proveedor, solicitante = crear_usuario('proveedor@test.com'), crear_usuario('solicitante@test.com')
+    c_prov, c_sol = cliente('proveedor@test.com'), cliente('solicitante@test.com')
+    crear_solicitudes(proveedor, solicitante, 1)
+    con_una = len(consultas_dashboard(c_prov, sentencias)), len(consultas_dashboard(c_sol, sentencias))
+    crear_solicitudes(proveedor, solicitante, 25)
+    con_n = len(consultas_dashboard(c_prov, sentencias)), len(consultas_dashboard(c_sol, sentencias))
+    assert con_una == con_n
+    assert max(con_n) <= 3
+
+def test_estadisticas_admin_desde_cache_dentro_del_ttl(sentencias):
+    c = cliente('admin@lifelink.com', 'admin123')
+    L._estadisticas['valor'] = None
+    primera = consultas_dashboard(c, sentencias)  # recalcula los COUNT(*) en la petición de calentamiento
+    L._estadisticas['valor'] = None
+    sentencias.clear(); assert c.get('/dashboard').status_code == 200
+    fria = list(sentencias)
+    caliente = consultas_dashboard(c, sentencias)
+    assert len(fria) - len(caliente) == 3
+    assert not any('count(' in s.lower() for s in caliente)
+    assert len(primera) == len(caliente)
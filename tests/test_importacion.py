@@ -0,0 +1,51 @@
+"""Importación masiva: errores por fila y corte limpio ante entradas que no se pueden seguir leyendo."""
+import pytest
+
+import lifelink_app as L
+
+FILA = 'Recurso,Sangre,Donacion,0,19.43,-99.13\n'
+CABECERA = 'nombre,categoria,tipo_publicacion,precio,latitud,longitud\n'
+
+@pytest.fixture(scope='module')
+def cliente():
+    with L.app.app_context():
+        if not L.User.query.filter_by(email='importador@test.com').first():
+            L.db.session.add(L.User(nombre='IMPORTADOR', email='importador@test.com', telefono='1', tipo_sangre='O+', ubicacion='CDMX', password_hash=L.hash_password('clave')))
+            L.db.session.commit()
+    c = L.app.test_client()
+    c.post('/login', data={'email': 'importador@test.com', 'password': 'clave'})
+    return c
+
+def importadas():
+    with L.app.app_context():
+        return L.Publicacion.query.join(L.User).filter(L.User.email == 'importador@test.com').count()
+
+def importar(cliente, cuerpo, tipo):
+    antes = importadas()
+    r = cliente.post('/api/publicaciones/importar', data=cuerpo, content_type=tipo)
+    assert r.status_code == 200
+    assert importadas() - antes == r.json['insertadas']  # el reporte coincide con lo confirmado
+    return r.json
+
+def test_errores_por_fila_con_tipos_invalidos(cliente):
+    cuerpo = '\n'.join(['{"nombre": 5, "categoria": "Sangre"}', '{"nombre": "a", "categoria": "Sangre", "direccion_text": 7}',
+                        '{"nombre": "b", "categoria": "Farmacia", "tipo_publicacion": "Venta", "precio": "nan"}', 'no es json',
+                        '{"nombre": "ok", "categoria": "Insumo"}'])
+    r = importar(cliente, cuerpo, 'application/x-ndjson')
+    assert r['insertadas'] == 1
+    assert [e['fila'] for e in r['errores']] == [1, 2, 3, 4]
+
+def test_campo_csv_enorme_detiene_sin_perder_lo_insertado(cliente):
+    cuerpo = CABECERA + FILA * 1500 + 'x' * 200000 + ',Sangre,Donacion,0,19.4,-99.1\n' + FILA * 10
+    r = importar(cliente, cuerpo, 'text/csv')
+    assert r['insertadas'] == 1500
+    assert r['errores'][-1]['fila'] == 1502 and 'detenida' in r['errores'][-1]['error']
+
+@pytest.mark.parametrize('formato, cuerpo', [
+    ('text/csv', (CABECERA + FILA * 1500).encode() + b'Caf\xe9,Sangre,Donacion,0,19.4,-99.1\n'),
+    ('application/x-ndjson', ('{"nombre": "ok", "categoria": "Sangre"}\n' * 1500).encode() + b'{"nombre": "\xff"}\n'),
+])
+def test_bytes_no_utf8_detienen_sin_perder_lo_insertado(cliente, formato, cuerpo):
+    r = importar(cliente, cuerpo, formato)
+    assert 0 < r['insertadas'] <= 1500
+    assert 'detenida' in r['errores'][-1]['error']
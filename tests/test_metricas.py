@@ -0,0 +1,80 @@
+"""Presupuesto de los hooks de métricas y formato de texto de /metrics.
+
+Las cifras detalladas (A/B de extremo a extremo) siguen en benchmarks/bench_metricas.py.
+"""
+import re
+import time
+
+import lifelink_app as L
+
+PRESUPUESTO_US = 50.0
+MARGEN = 5  # holgura para máquinas de CI lentas o cargadas
+SQL_POR_PETICION, PLANTILLAS_POR_PETICION = 5, 3
+
+MUESTRA = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_]\w*="(?:[^"\\]|\\.)*",?)*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+
+class _Conexion:
+    info = {}
+
+class _Plantilla:
+    name = 'prueba.html'
+
+def costo_hooks(n):
+    # Mismas llamadas que recibe una petición instrumentada, sin el trabajo de la vista
+    cx, tpl = _Conexion(), _Plantilla()
+    with L.app.test_request_context('/buscar'):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            L.metricas_inicio()
+            for _ in range(SQL_POR_PETICION):
+                L.sql_inicio(cx, None, 'SELECT 1', (), None, False); L.sql_fin(cx, None, 'SELECT 1', (), None, False)
+            for _ in range(PLANTILLAS_POR_PETICION):
+                L.plantilla_inicio(L.app, tpl, {}); L.plantilla_fin(L.app, tpl, {})
+            L.metricas_fin(None)
+        return (time.perf_counter() - t0) / n * 1e6
+
+def test_costo_de_hooks_dentro_del_presupuesto():
+    costo = min(costo_hooks(2000) for _ in range(3))
+    assert costo <= PRESUPUESTO_US * MARGEN, '%.1f us por petición' % costo
+
+def familias(texto):
+    # {nombre: (tipo, [(muestra, etiquetas, valor)])}, validando que HELP/TYPE precedan a las muestras
+    resultado, actual = {}, None
+    for linea in texto.splitlines():
+        if linea.startswith('# HELP '):
+            actual = linea.split()[2]; assert actual not in resultado, 'familia repetida: ' + actual
+        elif linea.startswith('# TYPE '):
+            _, _, nombre, tipo = linea.split()
+            assert nombre == actual and tipo in ('counter', 'gauge', 'histogram')
+            resultado[nombre] = (tipo, [])
+        else:
+            m = MUESTRA.match(linea); assert m, 'línea inválida: %r' % linea
+            nombre, etiquetas, valor = m.group(1), m.group(2) or '', m.group(3)
+            assert nombre == actual or nombre.rsplit('_', 1)[0] == actual, nombre
+            resultado[actual][1].append((nombre, etiquetas, valor))
+    return resultado
+
+def test_formato_de_metrics():
+    c = L.app.test_client()
+    c.get('/login'); c.get('/login')
+    r = c.get('/metrics')
+    assert r.status_code == 200 and r.mimetype == 'text/plain' and r.get_data(as_text=True).endswith('\n')
+    fam = familias(r.get_data(as_text=True))
+    tipo, muestras = fam['lifelink_http_request_seconds']
+    assert tipo == 'histogram'
+    login = [(n, v) for n, e, v in muestras if 'endpoint="login"' in e]
+    cubetas = [int(v) for n, v in login if n.endswith('_bucket')]
+    assert len(cubetas) == len(L.CUBETAS_SEGUNDOS) + 1 and cubetas == sorted(cubetas)
+    conteo = dict(login)['lifelink_http_request_seconds_count']
+    assert str(cubetas[-1]) == conteo and int(conteo) >= 2
+    assert float(dict(login)['lifelink_http_request_seconds_sum']) > 0
+    for nombre in ('lifelink_media_cola_profundidad', 'lifelink_chat_pendientes', 'lifelink_identidades_aciertos_total'):
+        assert nombre in fam
+    assert fam['lifelink_identidades_aciertos_total'][0] == 'counter'
+
+def test_etiquetas_escapadas():
+    m = L.Metricas()
+    m.observar('lifelink_socket_event_seconds', 'raro"\\\nevento', 0.002)
+    lineas = m.exportar()
+    assert 'lifelink_socket_event_seconds_count{evento="raro\\"\\\\\\nevento"} 1' in lineas
+    familias('\n'.join(lineas))